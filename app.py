@@ -1,17 +1,98 @@
+import hashlib
+import json
+from io import BytesIO
+from typing import Any, Callable
 import streamlit as st
 import pandas as pd
 
-from src.config import DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES
+from src.config import DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES, LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_DAYS, BASELINES_PATH, DUPLICATE_INDEX_PATH, KNN_PATH, RESULTS_STORE_PATH
+from src.config import APP_CACHE_MAX_ENTRIES, APP_CACHE_TTL_S, APP_CACHE_MAX_UPLOAD_MB, LLM_KEEP_ALIVE, LLM_ESCALATE_BELOW
 from src.ingest import ingest_csv
-from src.llm_client import OllamaClient, DisabledLLMClient
-from src.categorize import categorize_one
+from src.llm_client import OllamaClient, DisabledLLMClient, ModelCascade
+from src.categorize import categorize_batch
+from src.cache import CategoryCache
+from src.baselines import BaselineStore
+from src.duplicates import DuplicateIndex
+from src.knn import KNNCategorizer
+from src.rules import rules_hash
+from src.recategorize import recategorize
+from src.utils import fingerprint_ratio
 from src.anomalies import detect_anomalies
-from src.trends import monthly_trend, monthly_totals
+from src.trends import monthly_trend, monthly_totals, category_summary
+from src.rollup import Rollup
+from src.compact import compact_results, expand_results, export_frame, memory_per_row
 from src.report_pdf import generate_pdf_report
+from src.profiling import RunProfile, LATENCY_BUCKETS
 
 st.set_page_config(page_title="AI Expense Categorizer", layout="wide")
 st.title("AI Expense Categorizer (Hybrid Rules + AI)")
 
+@st.cache_resource
+def get_llm_cache() -> CategoryCache:
+    return CategoryCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_DAYS * 86400)
+
+@st.cache_resource
+def get_baseline_store() -> BaselineStore:
+    return BaselineStore(BASELINES_PATH)
+
+@st.cache_resource
+def get_duplicate_index() -> DuplicateIndex:
+    return DuplicateIndex(DUPLICATE_INDEX_PATH)
+
+@st.cache_resource
+def get_knn() -> KNNCategorizer:
+    return KNNCategorizer.load_or_new(KNN_PATH)
+
+@st.cache_resource
+def get_llm_client(base_url: str, model: str, timeout: float, keep_alive: str | None, pool_size: int) -> OllamaClient:
+    # Shared across reruns so the connection pool and circuit breaker persist
+    return OllamaClient(base_url=base_url, model=model, timeout=timeout, keep_alive=keep_alive, pool_size=pool_size)
+
+# -------- Stage caching --------
+# Each stage is keyed on a hash of its inputs (upload bytes, rules,
+# categories, settings) and of the upstream stage's key. Arguments with a
+# leading underscore are not hashed by st.cache_data; the key stands in
+# for them.
+def stage_key(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def session_memo(slot: str, key: str, fn: Callable[[], Any]) -> Any:
+    """One cached value per slot in this session; recomputed when `key` changes."""
+    if st.session_state.get(f"{slot}_key") != key:
+        st.session_state[slot] = fn()
+        st.session_state[f"{slot}_key"] = key
+    return st.session_state[slot]
+
+def frame_key(df: pd.DataFrame) -> str:
+    """Content hash of a frame, for caches shared between sessions."""
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return stage_key(list(df.columns), hashlib.sha1(rows.tobytes()).hexdigest())
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES, ttl=APP_CACHE_TTL_S, show_spinner="Reading CSV...")
+def cached_ingest(upload_key: str, _data: bytes) -> pd.DataFrame:
+    return ingest_csv(BytesIO(_data))
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES, ttl=APP_CACHE_TTL_S, show_spinner=False)
+def cached_reports(result_key: str, _df_out: pd.DataFrame):
+    rollup = Rollup.from_rows(_df_out)
+    return category_summary(rollup), monthly_totals(rollup), monthly_trend(rollup)
+
+@st.cache_data(max_entries=2, ttl=APP_CACHE_TTL_S, show_spinner="Building CSV...")
+def cached_csv(result_key: str, _df_out: pd.DataFrame) -> bytes:
+    return export_frame(_df_out).to_csv(index=False).encode("utf-8")
+
+@st.cache_data(max_entries=2, ttl=APP_CACHE_TTL_S, show_spinner="Building PDF...")
+def cached_pdf(pdf_key: str, _df_out: pd.DataFrame, _summary: pd.DataFrame, _m_tot: pd.DataFrame, full: bool, max_pages: int | None) -> bytes:
+    return generate_pdf_report(
+        df_out=expand_results(_df_out),
+        category_summary=_summary,
+        monthly_totals=_m_tot,
+        title="AI Expense Categorizer Report",
+        anomaly_limit=None if full else 15,
+        include_transactions=full,
+        max_pages=max_pages,
+    )
+
 # -------- Session state init --------
 if "categories" not in st.session_state:
     st.session_state["categories"] = DEFAULT_CATEGORIES.copy()
@@ -26,15 +107,54 @@ with st.sidebar:
     llm_enabled = st.checkbox("Enable LLM (Ollama local)", value=True)
     ollama_model = st.text_input("Ollama model", value="llama3.1:8b")
     ollama_url = st.text_input("Ollama base URL", value="http://localhost:11434")
+    fast_model = st.text_input("Fast model tried first (optional)", value="", help="e.g. llama3.2:1b; answers below the confidence threshold go to the model above").strip()
+    escalate_below = st.slider("Escalate fast-model answers below confidence", 0.0, 1.0, LLM_ESCALATE_BELOW, 0.05, disabled=not fast_model)
+    llm_workers = st.number_input("Concurrent LLM requests", min_value=1, max_value=32, value=4, step=1)
+    llm_batch_size = st.number_input("Descriptions per LLM call", min_value=1, max_value=50, value=1, step=1)
+    compact_prompts_on = st.checkbox("Compact prompts (category ids, JSON schema output)", value=False)
+    llm_reasons_on = st.checkbox("Ask the LLM for reasons", value=not compact_prompts_on)
+    llm_timeout = st.number_input("LLM request timeout (seconds)", min_value=5, max_value=600, value=90, step=5)
+    llm_keep_alive = st.text_input("Keep model loaded for", value=LLM_KEEP_ALIVE, help="Ollama keep_alive, e.g. 30m; -1 keeps it loaded")
+    llm_client_live = get_llm_client(ollama_url, ollama_model, float(llm_timeout), llm_keep_alive.strip() or None, int(llm_workers))
+    colH, colP = st.columns(2)
+    if colH.button("Check connection", disabled=not llm_enabled):
+        health = llm_client_live.health()
+        if not health["server"]:
+            st.error(f"Ollama unreachable: {health['error']}")
+        elif not health["model_available"]:
+            st.warning(f"Model {ollama_model} is not pulled (ollama pull {ollama_model}).")
+        else:
+            st.success("Connected; model " + ("loaded." if health["model_loaded"] else "available, not loaded yet."))
+    fast_client = get_llm_client(ollama_url, fast_model, float(llm_timeout), llm_keep_alive.strip() or None, int(llm_workers)) if fast_model else None
+    if colP.button("Preload model", disabled=not llm_enabled):
+        with st.spinner(f"Loading {ollama_model}..."):
+            if llm_client_live.preload() and (fast_client is None or fast_client.preload()):
+                st.success("Model loaded.")
+            else:
+                st.error("Preload failed; check the connection.")
+    if llm_enabled and llm_client_live.breaker.is_open:
+        st.warning("LLM paused after repeated failures; rows fall back to Other until it responds again.")
+    llm_cache_on = st.checkbox("Cache LLM results on disk", value=True)
+    canonicalize_on = st.checkbox("Classify one description per merchant fingerprint", value=True)
+    knn_on = st.checkbox("Learn from past results (nearest-neighbour tier before LLM)", value=True)
 
     st.divider()
     st.subheader("Anomaly Thresholds")
     manual_threshold_on = st.checkbox("Enable manual high-amount threshold", value=False)
     manual_high_amt = st.number_input("High amount threshold", min_value=0.0, value=25000.0, step=1000.0)
+    baselines_on = st.checkbox("Score against saved history (category / merchant baselines)", value=False)
+    baselines_update = st.checkbox("Add this upload to saved history", value=False, disabled=not baselines_on)
+    archive_dups_on = st.checkbox("Check duplicates against earlier uploads", value=False)
+    archive_dups_update = st.checkbox("Archive this upload for future duplicate checks", value=False, disabled=not archive_dups_on)
 
     st.divider()
     st.subheader("Processing Options")
     max_rows = st.number_input("Max rows to process (demo safety)", min_value=50, max_value=20000, value=2000, step=50)
+    trace_memory_on = st.checkbox("Trace Python memory in run profile (slower)", value=False)
+    store_results_on = st.checkbox("Append results to the Parquet results store", value=False)
+    compact_on = st.checkbox("Compact results in memory (drops raw amount/date text)", value=True)
+    pdf_full = st.checkbox("Full PDF listings (all anomalies + transaction appendix)", value=False)
+    pdf_max_pages = st.number_input("PDF page budget for listings", min_value=5, max_value=5000, value=200, step=5, disabled=not pdf_full)
 
 # -------- Categories editor --------
 st.write("## Editable Categories")
@@ -100,8 +220,19 @@ if not uploaded:
     st.stop()
 
 # -------- Ingestion --------
+# Records stage timings and counters for this script run; kept for the
+# profile panel only when the pipeline button was pressed. Entered only
+# around the work, so st.stop()/st.rerun() and errors always stop it.
+profile = RunProfile(trace_memory=trace_memory_on)
+upload_bytes = uploaded.getvalue()
+upload_key = hashlib.sha1(upload_bytes).hexdigest()
 try:
-    df = ingest_csv(uploaded)
+    with profile:
+        if len(upload_bytes) <= APP_CACHE_MAX_UPLOAD_MB * 2**20:
+            df = cached_ingest(upload_key, upload_bytes)
+        else:
+            # Too big for the shared cache: keep a single copy for this session
+            df = session_memo("ingested", upload_key, lambda: ingest_csv(BytesIO(upload_bytes)))
 except Exception as e:
     st.error(f"CSV ingestion failed: {e}")
     st.stop()
@@ -127,49 +258,126 @@ st.dataframe(df_ok.head(20), use_container_width=True)
 # -------- Run pipeline --------
 run = st.button("Run Categorization + Anomaly Detection", type="primary")
 
-if run:
-    categories = st.session_state["categories"]
-    merchant_rules = st.session_state["merchant_rules"]
+categories = st.session_state["categories"]
+merchant_rules = st.session_state["merchant_rules"]
+# Everything categorization depends on except rules and categories; while
+# it is unchanged, edits to those only recompute the rows they can affect.
+source_key = stage_key(
+    upload_key, int(max_rows),
+    llm_enabled, ollama_model, fast_model, escalate_below, ollama_url, int(llm_batch_size), compact_prompts_on, llm_reasons_on, canonicalize_on, knn_on, compact_on,
+)
+categorize_key = stage_key(source_key, categories, rules_hash(merchant_rules))
+manual_threshold = manual_high_amt if (manual_threshold_on and manual_high_amt > 0) else None
+anomaly_key = stage_key(categorize_key, manual_threshold, baselines_on, archive_dups_on)
 
+def run_categorize() -> pd.DataFrame:
     if llm_enabled:
-        llm_client = OllamaClient(base_url=ollama_url, model=ollama_model)
+        llm_client = llm_client_live
+        if fast_client is not None:
+            llm_client = ModelCascade([fast_client, llm_client_live], escalate_below=escalate_below)
     else:
         llm_client = DisabledLLMClient()
+    batch_kwargs = dict(
+        max_workers=int(llm_workers),
+        batch_size=int(llm_batch_size) if llm_enabled else 1,
+        cache=get_llm_cache() if (llm_enabled and llm_cache_on) else None,
+        canonicalize=canonicalize_on,
+        knn=get_knn() if knn_on else None,
+        compact_prompts=compact_prompts_on,
+        llm_reasons=llm_reasons_on,
+    )
 
-    results = []
-    for desc in df_ok["description"].tolist():
-        results.append(categorize_one(desc, llm_client, categories, merchant_rules))
-
-    res_df = pd.DataFrame(results)
-    df_out = pd.concat([df_ok.reset_index(drop=True), res_df], axis=1)
-
-    df_out = detect_anomalies(
-        df_out,
-        manual_high_threshold=(manual_high_amt if (manual_threshold_on and manual_high_amt > 0) else None)
+    basis = st.session_state.get("categorized_basis")
+    if "categorized" in st.session_state and basis and basis["source_key"] == source_key:
+        out, diff = recategorize(
+            expand_results(st.session_state["categorized"]),
+            basis["merchant_rules"],
+            merchant_rules,
+            basis["categories"],
+            categories,
+            llm_client,
+            **batch_kwargs,
+        )
+        st.session_state["recategorize_diff"] = (categorize_key, diff)
+    else:
+        results = categorize_batch(
+            df_ok["description"].tolist(),
+            llm_client,
+            categories,
+            merchant_rules,
+            desc_norm=df_ok["desc_norm"].tolist(),
+            **batch_kwargs,
+        )
+        out = pd.concat([df_ok.reset_index(drop=True), pd.DataFrame(results)], axis=1)
+        st.session_state.pop("recategorize_diff", None)
+    if knn_on:
+        get_knn().save(KNN_PATH)
+    st.session_state["categorized_basis"] = {
+        "source_key": source_key,
+        "merchant_rules": dict(merchant_rules),
+        "categories": list(categories),
+    }
+    return compact_results(out) if compact_on else out
+
+def run_anomalies() -> pd.DataFrame:
+    out = detect_anomalies(
+        expand_results(categorized),
+        manual_high_threshold=manual_threshold,
+        baselines=get_baseline_store() if baselines_on else None,
+        update_baselines=baselines_on and baselines_update,
+        # Re-scoring the same upload (new threshold, toggles) folds it in once
+        batch_key=upload_key,
+        dup_index=get_duplicate_index() if archive_dups_on else None,
+        source=uploaded.name,
+        update_dup_index=archive_dups_on and archive_dups_update,
     )
+    if store_results_on:
+        from src.store import ResultStore
+        ResultStore(RESULTS_STORE_PATH).append(out, source=uploaded.name)
+    return compact_results(out) if compact_on else out
 
-    st.session_state["df_out"] = df_out
+if run:
+    # Stages whose inputs are unchanged since the last run are reused, so
+    # e.g. a new threshold re-scores anomalies without calling the LLM.
+    if st.session_state.get("df_out_key") == anomaly_key:
+        st.info("Inputs unchanged since the last run; showing the cached results.")
+    with profile:
+        categorized = session_memo("categorized", categorize_key, run_categorize)
+        session_memo("df_out", anomaly_key, run_anomalies)
+    st.session_state["fingerprint_ratio"] = fingerprint_ratio(df_ok["desc_norm"])
+    if llm_enabled and llm_cache_on:
+        st.session_state["llm_cache_stats"] = get_llm_cache().stats()
 
 # -------- Show outputs --------
 if "df_out" not in st.session_state:
     st.stop()
 
 df_out = st.session_state["df_out"]
+if st.session_state["df_out_key"] != anomaly_key:
+    st.warning("Settings or data changed since these results were computed; press Run to update them.")
+
+# The stage key leaves out the file name and shared state (kNN model,
+# baselines, duplicate index), so the shared caches below key on content
+result_key = session_memo("df_out_hash", st.session_state["df_out_key"], lambda: frame_key(df_out))
 
 st.write("## Categorized Transactions")
-st.dataframe(df_out, use_container_width=True)
+st.dataframe(expand_results(df_out), use_container_width=True)
+st.caption(f"Held in memory: {memory_per_row(df_out) * len(df_out) / 2**20:.1f} MB ({memory_per_row(df_out):.0f} bytes/row)")
+
+diff_for, recat_diff = st.session_state.get("recategorize_diff", (None, None))
+if diff_for is not None and diff_for == st.session_state.get("categorized_key"):
+    with st.expander(f"Changed by the last rule / category edit ({len(recat_diff)} rows)", expanded=bool(len(recat_diff))):
+        st.caption("Only rows matching edited keywords, or LLM rows whose category was removed, were recomputed.")
+        st.dataframe(recat_diff, use_container_width=True)
 
 # Summary by category
 st.write("## Summary Report")
 
-summary = (
-    df_out.groupby("category")["amount"].sum()
-    .reset_index()
-    .sort_values("amount", ascending=False)
-)
-
+with profile:
+    summary, m_tot, m_pivot = cached_reports(result_key, df_out)
+if run:
+    st.session_state["run_profile"] = profile.report()
 total_spend = summary["amount"].sum() if len(summary) else 0.0
-summary["percent"] = (summary["amount"] / total_spend * 100).round(2) if total_spend else 0.0
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Total spend", f"{total_spend:.2f}")
@@ -178,12 +386,14 @@ col3.metric("Anomalies flagged", f"{int(df_out['is_anomaly'].sum())}")
 
 st.dataframe(summary, use_container_width=True)
 
+st.caption(f"Unique merchant fingerprints / rows: {st.session_state.get('fingerprint_ratio', 0.0):.3f}")
+if "llm_cache_stats" in st.session_state:
+    cs = st.session_state["llm_cache_stats"]
+    st.caption(f"LLM cache: {cs['hits']} hits, {cs['misses']} misses since app start, {cs['entries']} stored entries")
+
 # Monthly trend analysis
 st.write("## Monthly Trend Analysis")
 
-m_tot = monthly_totals(df_out)
-m_pivot = monthly_trend(df_out)
-
 colT1, colT2 = st.columns([1, 1])
 with colT1:
     st.write("### Monthly totals")
@@ -198,7 +408,7 @@ with colT2:
 
 # Anomalies
 st.write("## Anomalies")
-anom = df_out[df_out["is_anomaly"]].copy()
+anom = expand_results(df_out[df_out["is_anomaly"]])
 if len(anom) > 0:
     st.dataframe(anom[["date", "amount", "description", "category", "confidence", "method", "anomaly_labels"]], use_container_width=True)
 else:
@@ -207,23 +417,72 @@ else:
 # Downloads: CSV + PDF
 st.write("## Export Reports")
 
-csv_bytes = df_out.to_csv(index=False).encode("utf-8")
-st.download_button(
-    "Download categorized CSV",
-    data=csv_bytes,
-    file_name="categorized_expenses.csv",
-    mime="text/csv"
-)
-
-pdf_bytes = generate_pdf_report(
-    df_out=df_out,
-    category_summary=summary,
-    monthly_totals=m_tot,
-    title="AI Expense Categorizer Report"
-)
-st.download_button(
-    "Download PDF report",
-    data=pdf_bytes,
-    file_name="expense_report.pdf",
-    mime="application/pdf"
-)
+# Files are only built once asked for, then kept until the results change
+pdf_key = stage_key(result_key, pdf_full, int(pdf_max_pages) if pdf_full else None)
+col_csv, col_pdf = st.columns(2)
+with col_csv:
+    if st.session_state.get("csv_requested") != result_key:
+        if st.button("Prepare categorized CSV"):
+            st.session_state["csv_requested"] = result_key
+            st.rerun()
+    else:
+        st.download_button(
+            "Download categorized CSV",
+            data=cached_csv(result_key, df_out),
+            file_name="categorized_expenses.csv",
+            mime="text/csv"
+        )
+with col_pdf:
+    if st.session_state.get("pdf_requested") != pdf_key:
+        if st.button("Prepare PDF report"):
+            st.session_state["pdf_requested"] = pdf_key
+            st.rerun()
+    else:
+        st.download_button(
+            "Download PDF report",
+            data=cached_pdf(pdf_key, df_out, summary, m_tot, pdf_full, int(pdf_max_pages) if pdf_full else None),
+            file_name="expense_report.pdf",
+            mime="application/pdf"
+        )
+
+# -------- Run profile --------
+if "run_profile" in st.session_state:
+    rp = st.session_state["run_profile"]
+    with st.expander("Run profile (last run)"):
+        stages = pd.DataFrame(
+            [{"stage": k, "seconds": v["seconds"], "calls": v["calls"]} for k, v in rp["stages"].items()]
+        )
+        if len(stages):
+            st.bar_chart(stages.set_index("stage")["seconds"])
+            st.dataframe(stages, use_container_width=True)
+        st.write("Counters")
+        st.json(rp["counters"])
+        llm_calls = rp["counters"].get("llm_calls", 0)
+        if llm_calls and "llm_output_tokens" in rp["counters"]:
+            st.write(
+                f"LLM tokens per call: {rp['counters'].get('llm_prompt_tokens', 0) / llm_calls:.0f} prompt, "
+                f"{rp['counters']['llm_output_tokens'] / llm_calls:.0f} generated; "
+                f"{rp['counters'].get('llm_parse_failures', 0)} unparseable answers"
+            )
+        first_tier = rp["counters"].get("llm_tier0_rows", 0)
+        if first_tier:
+            escalated = rp["counters"].get("llm_escalated", 0)
+            tiers = [h for h in sorted(rp["histograms"]) if h.startswith("llm_tier")]
+            st.write(
+                f"Cascade: {escalated} of {first_tier} descriptions escalated ({escalated / first_tier:.0%}); "
+                + ", ".join(f"{h.split('_')[1]} mean {rp['histograms'][h]['mean']:.2f}s" for h in tiers)
+            )
+        lat = rp["histograms"].get("llm_latency_s")
+        if lat:
+            st.write(f"LLM latency: {lat['count']} calls, mean {lat['mean']:.2f}s, max {lat['max']:.2f}s")
+            labels = [f"<= {b}s" for b in LATENCY_BUCKETS[:-1]] + [f"> {LATENCY_BUCKETS[-2]}s"]
+            st.bar_chart(pd.DataFrame({"bucket": labels, "calls": lat["buckets"]}).set_index("bucket"))
+        mem = [f"{k}: {rp[k]} MB" for k in ("peak_rss_mb", "peak_traced_mb") if k in rp]
+        if mem:
+            st.caption("Memory " + ", ".join(mem))
+        st.download_button(
+            "Download run profile (JSON)",
+            data=json.dumps(rp, indent=2),
+            file_name="run_profile.json",
+            mime="application/json"
+        )
@@ -0,0 +1,250 @@
+"""Behaviour checks that need more than one run or a live server, e.g.
+
+    python -m benchmarks.checks knn-stable
+    python -m benchmarks.checks knn-holdout
+    python -m benchmarks.checks recategorize sample_data/*.csv
+    python -m benchmarks.checks breaker
+    python -m benchmarks.checks concurrency --workers 1 2 4 8
+
+Each check prints what it compared and exits non-zero on a mismatch.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.run import dataset
+from benchmarks.stub_llm import StubLLMClient
+from benchmarks.stub_server import StubOllamaServer
+from src.categorize import categorize_batch
+from src.config import DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES
+from src.ingest import ingest_csv
+from src.knn import KNNCategorizer
+from src.llm_client import LLMUnavailableError, OllamaClient
+from src.recategorize import recategorize
+
+def _valid_rows(args: argparse.Namespace) -> List[Tuple[str, pd.DataFrame]]:
+    # Rows of the given files, or of a synthetic statement whose long-tail
+    # merchants miss the rules (sample_data is almost all rule hits)
+    paths = args.paths or [dataset(args.rows, args.seed)]
+    out = []
+    for path in paths:
+        df = ingest_csv(path)
+        out.append((path, df[df["row_valid"]].reset_index(drop=True)))
+    return out
+
+def _categorize(df: pd.DataFrame, llm: StubLLMClient, knn: KNNCategorizer | None) -> pd.DataFrame:
+    return pd.DataFrame(categorize_batch(
+        df["description"].tolist(), llm, DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES,
+        desc_norm=df["desc_norm"].tolist(), knn=knn,
+    ))
+
+def check_knn_stable(args: argparse.Namespace) -> bool:
+    """Categorize each file twice with one kNN model that learns from the
+    first run; the second run must answer some rows from kNN and give the
+    same categories."""
+    ok = True
+    for path, df in _valid_rows(args):
+        knn = KNNCategorizer()
+        runs = []
+        for _ in range(2):
+            runs.append(_categorize(df, StubLLMClient(latency=0.0), knn))
+        changed = runs[0]["category"] != runs[1]["category"]
+        answered = int((runs[1]["method"] == "knn").sum())
+        print(f"{path}: {len(df)} rows, kNN learned {len(knn)} merchants, "
+              f"{answered} kNN answers on the second run, {int(changed.sum())} changed")
+        if answered == 0:
+            ok = False
+        if changed.any():
+            ok = False
+            sample = pd.DataFrame({
+                "description": df.loc[changed, "description"],
+                "first": runs[0].loc[changed, "category"],
+                "second": runs[1].loc[changed, "category"],
+                "reason": runs[1].loc[changed, "reason"],
+            })
+            print(sample.head(10).to_string(index=False))
+    return ok
+
+def check_knn_holdout(args: argparse.Namespace) -> bool:
+    """Categorize the first half of each file, then the second half, with and
+    without a kNN model trained on the first; kNN must answer some rows and
+    save LLM calls."""
+    ok = True
+    for path, df in _valid_rows(args):
+        first, second = df.iloc[:len(df) // 2], df.iloc[len(df) // 2:]
+        calls = {}
+        for name, knn in (("without", None), ("with", KNNCategorizer())):
+            if knn is not None:
+                _categorize(first, StubLLMClient(latency=0.0), knn)
+            llm = StubLLMClient(latency=0.0)
+            out = _categorize(second, llm, knn)
+            calls[name] = llm.calls
+        answered = int((out["method"] == "knn").sum())
+        print(f"{path}: second half of {len(second)} rows, {calls['with']} LLM calls with kNN "
+              f"({answered} kNN answers) against {calls['without']} without")
+        if answered == 0 or calls["with"] >= calls["without"]:
+            ok = False
+    return ok
+
+def _rule_edits() -> Dict[str, Dict[str, str]]:
+    rules = dict(DEFAULT_MERCHANT_RULES)
+    first = next(iter(rules))
+    remapped = dict(rules)
+    remapped[first] = "Other"
+    return {
+        "reversed order": dict(reversed(list(rules.items()))),
+        "first rule removed": {k: v for k, v in rules.items() if k != first},
+        "first rule remapped": remapped,
+    }
+
+def check_recategorize(args: argparse.Namespace) -> bool:
+    """After each rules edit, recategorize() must give the same categories
+    as categorizing from scratch with the new rules."""
+    ok = True
+    for path in args.paths:
+        df = ingest_csv(path)
+        df = df[df["row_valid"]].reset_index(drop=True)
+
+        def full(rules: Dict[str, str]) -> pd.DataFrame:
+            return pd.DataFrame(categorize_batch(
+                df["description"].tolist(), StubLLMClient(latency=0.0), DEFAULT_CATEGORIES, rules,
+                desc_norm=df["desc_norm"].tolist(),
+            ))
+
+        base = pd.concat([df, full(DEFAULT_MERCHANT_RULES)], axis=1)
+        for name, rules in _rule_edits().items():
+            out, diff = recategorize(base, DEFAULT_MERCHANT_RULES, rules, DEFAULT_CATEGORIES, DEFAULT_CATEGORIES, StubLLMClient(latency=0.0))
+            wrong = out["category"].to_numpy() != full(rules)["category"].to_numpy()
+            print(f"{path}, {name}: {len(diff)} rows changed, {int(wrong.sum())} differ from a full run")
+            if wrong.any():
+                ok = False
+                print(out.loc[wrong, ["description", "category"]].head(5).to_string(index=False))
+    return ok
+
+def _call(client: OllamaClient) -> str:
+    try:
+        client.classify_json('Transaction description: "ACME HARDWARE"')
+    except LLMUnavailableError:
+        return "short-circuit"
+    except Exception:
+        return "error"
+    return "ok"
+
+def check_breaker(args: argparse.Namespace) -> bool:
+    """Walk OllamaClient's circuit breaker through closed -> open ->
+    half-open -> open -> half-open -> closed against the stub server,
+    counting which calls actually reach it."""
+    results: List[bool] = []
+
+    def step(name: str, ok: bool) -> None:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        results.append(ok)
+
+    with StubOllamaServer(latency=0.01) as server:
+        client = OllamaClient(base_url=server.url, timeout=5, breaker_threshold=args.threshold, breaker_cooldown_s=args.cooldown)
+        breaker = client.breaker
+        step("closed: a call succeeds", _call(client) == "ok" and not breaker.is_open)
+
+        server.fail = True
+        calls = [_call(client) for _ in range(args.threshold)]
+        step(f"open after {args.threshold} consecutive failures", calls == ["error"] * args.threshold and breaker.is_open)
+
+        server.reset_counters()
+        calls = [_call(client) for _ in range(5)]
+        step("open: calls fail fast without reaching the server", calls == ["short-circuit"] * 5 and server.requests == 0)
+
+        time.sleep(args.cooldown)
+        first, second = _call(client), _call(client)
+        step("half-open: one trial reaches the server, fails and reopens",
+             (first, second) == ("error", "short-circuit") and server.requests == 1 and breaker.is_open)
+
+        server.fail = False
+        server.latency = 0.2
+        time.sleep(args.cooldown)
+        server.reset_counters()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            calls = sorted(pool.map(lambda _: _call(client), range(4)))
+        step("half-open: concurrent callers send a single trial, which succeeds and closes",
+             calls == ["ok"] + ["short-circuit"] * 3 and server.requests == 1 and not breaker.is_open)
+
+        step("closed: calls reach the server again", _call(client) == "ok" and server.requests == 2)
+    return all(results)
+
+def _unknown_merchants(n: int, seed: int = 0) -> List[str]:
+    # Random letters: no merchant rule matches and every row is distinct
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("BCDFGHJKLMNPQRSTVWXZ"))
+    return [f"{''.join(rng.choice(letters, 10))} {''.join(rng.choice(letters, 8))}" for _ in range(n)]
+
+def check_concurrency(args: argparse.Namespace) -> bool:
+    """Categorize rule misses through OllamaClient against the stub server
+    at each worker count. Requests must overlap up to max_workers and no
+    further, and throughput must stay within `min_efficiency` of
+    workers / latency."""
+    descriptions = _unknown_merchants(args.rows)
+    ok = True
+    print(f"{'workers':>7} {'requests':>8} {'seconds':>8} {'req/s':>7} {'ideal':>7} {'in flight':>9}")
+    with StubOllamaServer(latency=args.latency) as server:
+        for workers in args.workers:
+            client = OllamaClient(base_url=server.url, timeout=10, pool_size=workers)
+            server.reset_counters()
+            t0 = time.perf_counter()
+            results = categorize_batch(
+                descriptions, client, DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES,
+                max_workers=workers, batch_size=args.batch_size, retries=0,
+            )
+            seconds = time.perf_counter() - t0
+            rate = server.requests / seconds
+            ideal = workers / args.latency
+            row_ok = (
+                server.max_in_flight == workers
+                and rate >= args.min_efficiency * ideal
+                and all(r["method"] == "llm" for r in results)
+            )
+            ok = ok and row_ok
+            print(f"{workers:>7} {server.requests:>8} {seconds:>8.2f} {rate:>7.1f} {ideal:>7.1f} {server.max_in_flight:>9}{'' if row_ok else '  FAIL'}")
+    return ok
+
+CHECKS: Dict[str, Callable[[argparse.Namespace], bool]] = {
+    "knn-stable": check_knn_stable,
+    "knn-holdout": check_knn_holdout,
+    "recategorize": check_recategorize,
+    "breaker": check_breaker,
+    "concurrency": check_concurrency,
+}
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a behaviour check.")
+    sub = parser.add_subparsers(dest="check", required=True)
+    for name, text in (
+        ("knn-stable", "A second run with the learned kNN model answers rows from kNN and gives the same categories"),
+        ("knn-holdout", "A kNN model trained on the first half of a file saves LLM calls on the second half"),
+    ):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("paths", nargs="*", help="CSV files (default: a synthetic statement)")
+        p.add_argument("--rows", type=int, default=20_000, help="Synthetic rows")
+        p.add_argument("--seed", type=int, default=0)
+    p = sub.add_parser("recategorize", help="Recategorizing after a rules edit (including reordering) matches a full run")
+    p.add_argument("paths", nargs="+", help="CSV files")
+    p = sub.add_parser("breaker", help="The LLM circuit breaker opens, half-opens and closes against a stub server")
+    p.add_argument("--threshold", type=int, default=3, help="Failures that open the breaker")
+    p.add_argument("--cooldown", type=float, default=0.5, help="Seconds before a trial call")
+    p = sub.add_parser("concurrency", help="LLM throughput scales with max_workers against a stub server")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--rows", type=int, default=200, help="Rule-miss descriptions per run")
+    p.add_argument("--latency", type=float, default=0.05, help="Stub server seconds per request")
+    p.add_argument("--batch-size", type=int, default=1)
+    p.add_argument("--min-efficiency", type=float, default=0.7, help="Required share of workers / latency requests per second")
+    args = parser.parse_args(argv)
+
+    ok = CHECKS[args.check](args)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
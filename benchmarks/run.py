@@ -0,0 +1,205 @@
+"""Per-stage throughput and memory benchmarks on synthetic statements.
+
+    python -m benchmarks.run --rows 10000 100000 1000000
+    python -m benchmarks.run --rows 100000 --compare benchmarks/results/<earlier>.json
+
+Each size is generated once (seeded, cached under benchmarks/data/) and run
+through ingest -> rules -> categorize (stub LLM) -> anomalies -> trends ->
+pdf. Results go to benchmarks/results/<timestamp>_<commit>.json so runs on
+different commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stub_llm import StubLLMClient
+from src.llm_client import ModelCascade
+from benchmarks.synthetic import write_csv
+from src.anomalies import detect_anomalies
+from src.categorize import categorize_batch, rule_based_categories
+from src.compact import compact_results, memory_per_row
+from src.config import DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES, COMPACT_TARGET_BYTES_PER_ROW
+from src.ingest import ingest_csv, iter_ingest_csv
+from src.profiling import RunProfile
+from src.trends import monthly_trend, monthly_totals, category_summary
+from src.rollup import Rollup
+
+STAGES = ["ingest", "ingest_chunked", "rules", "categorize", "anomalies", "compact", "trends", "pdf"]
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+def dataset(rows: int, seed: int) -> str:
+    path = os.path.join(DATA_DIR, f"synthetic_{rows}_{seed}.csv")
+    if not os.path.exists(path):
+        write_csv(path, rows, seed=seed)
+    return path
+
+def measure(stage: str, rows: int, fn: Callable[[], Any], trace_memory: bool, repeat: int = 1) -> Tuple[Any, Dict[str, Any]]:
+    """Run fn `repeat` times; report the fastest run's time and its profile."""
+    best: Dict[str, Any] | None = None
+    out = None
+    for _ in range(max(1, repeat)):
+        with RunProfile(trace_memory=trace_memory) as prof:
+            out = fn()
+        rep = prof.report()
+        if best is None or rep["wall_s"] < best["wall_s"]:
+            best = rep
+    seconds = best["wall_s"]
+    return out, {
+        "stage": stage,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_s": round(rows / seconds) if seconds > 0 else None,
+        "peak_traced_mb": best.get("peak_traced_mb"),
+        "peak_rss_mb": best.get("peak_rss_mb"),
+        "counters": best["counters"],
+    }
+
+def run_size(rows: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    path = dataset(rows, args.seed)
+    results = []
+
+    def record(stage: str, fn: Callable[[], Any], repeat: int = args.repeat) -> Any:
+        out, res = measure(stage, rows, fn, args.trace_memory, repeat)
+        results.append(res)
+        print(f"  {stage:<15} {res['seconds']:>9.3f}s  {res['rows_per_s'] or 0:>12,} rows/s"
+              + (f"  {res['peak_traced_mb']:>8.1f} MB traced" if res["peak_traced_mb"] is not None else ""))
+        return out
+
+    df = record("ingest", lambda: ingest_csv(path))
+    if "ingest_chunked" in args.stages:
+        record("ingest_chunked", lambda: sum(len(c) for c in iter_ingest_csv(path)))
+    df_ok = df[df["row_valid"]].reset_index(drop=True)
+    del df
+
+    if "rules" in args.stages:
+        record("rules", lambda: rule_based_categories(df_ok["description"], DEFAULT_MERCHANT_RULES, DEFAULT_CATEGORIES, df_ok["desc_norm"]))
+
+    # Single run: it is dominated by stub LLM latency, not CPU noise
+    client = StubLLMClient(latency=args.llm_latency, per_item=args.llm_per_item, jitter=args.llm_jitter, seed=args.seed)
+    if args.fast_latency is not None:
+        # Keyword misses come back at 0.6 confidence and escalate
+        fast = StubLLMClient(latency=args.fast_latency, per_item=args.llm_per_item / 4, jitter=args.llm_jitter, seed=args.seed + 1, model="stub-fast")
+        client = ModelCascade([fast, client], escalate_below=args.escalate_below)
+    categorized = record(
+        "categorize",
+        lambda: categorize_batch(
+            df_ok["description"].tolist(),
+            client,
+            DEFAULT_CATEGORIES,
+            DEFAULT_MERCHANT_RULES,
+            max_workers=args.llm_workers,
+            batch_size=args.batch_size,
+            canonicalize=True,
+            desc_norm=df_ok["desc_norm"].tolist(),
+            compact_prompts=args.compact_prompts,
+            llm_reasons=not args.compact_prompts,
+        ),
+        repeat=1,
+    )
+    frame = pd.concat([df_ok, pd.DataFrame(categorized)], axis=1)
+    del categorized
+
+    df_out = record("anomalies", lambda: detect_anomalies(frame)) if "anomalies" in args.stages else detect_anomalies(frame, with_labels=False)
+    if "compact" in args.stages:
+        compacted = record("compact", lambda: compact_results(df_out))
+        before, after = memory_per_row(df_out), memory_per_row(compacted)
+        results[-1].update(bytes_per_row=round(before), compact_bytes_per_row=round(after), target_bytes_per_row=COMPACT_TARGET_BYTES_PER_ROW)
+        print(f"  {'':<15} {before:,.0f} -> {after:,.0f} bytes/row (target {COMPACT_TARGET_BYTES_PER_ROW})"
+              + ("" if after <= COMPACT_TARGET_BYTES_PER_ROW else "  OVER TARGET"))
+        del compacted
+
+    if "trends" in args.stages:
+        def trends():
+            rollup = Rollup.from_rows(df_out)
+            return monthly_trend(rollup), monthly_totals(rollup), category_summary(rollup)
+        record("trends", trends)
+
+    if "pdf" in args.stages:
+        try:
+            from src.report_pdf import generate_pdf_report
+        except ImportError:
+            print("  pdf             skipped (reportlab not installed)")
+        else:
+            rollup = Rollup.from_rows(df_out)
+            summary, m_tot = category_summary(rollup), monthly_totals(rollup)
+            record("pdf", lambda: generate_pdf_report(df_out=df_out, category_summary=summary, monthly_totals=m_tot))
+    return results
+
+def _git(*cmd: str) -> str:
+    try:
+        return subprocess.run(["git", *cmd], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+def environment() -> Dict[str, Any]:
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def compare(current: List[Dict[str, Any]], baseline_path: str, args_trace_memory: bool = False) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    old = {(r["stage"], r["rows"]): r for r in base["results"]}
+    print(f"\nvs {os.path.basename(baseline_path)} (commit {base['env']['commit']}):")
+    if base["args"].get("trace_memory") != args_trace_memory:
+        print("  note: only one of the runs traced memory, which slows every stage")
+    print(f"  {'stage':<15} {'rows':>10} {'before':>9} {'after':>9} {'speedup':>8}")
+    for r in current:
+        b = old.get((r["stage"], r["rows"]))
+        if b is None:
+            continue
+        speedup = b["seconds"] / r["seconds"] if r["seconds"] else float("inf")
+        print(f"  {r['stage']:<15} {r['rows']:>10,} {b['seconds']:>8.3f}s {r['seconds']:>8.3f}s {speedup:>7.2f}x")
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on seeded synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="Dataset sizes (10k-10M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES, help="Optional stages to run (ingest and categorize always run)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub LLM seconds per call")
+    parser.add_argument("--llm-per-item", type=float, default=0.0, help="Extra stub seconds per description in a batch")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="Lognormal sigma applied to stub latency")
+    parser.add_argument("--fast-latency", type=float, default=None, help="Add a cheaper first stub tier with this latency (model cascade)")
+    parser.add_argument("--escalate-below", type=float, default=0.7, help="Cascade escalation threshold")
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--compact-prompts", action="store_true", help="Use compact prompts (category ids, no reasons)")
+    parser.add_argument("--trace-memory", action="store_true", help="Record tracemalloc peaks (slows every stage)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    results: List[Dict[str, Any]] = []
+    for rows in args.rows:
+        print(f"{rows:,} rows")
+        results.extend(run_size(rows, args))
+
+    env = environment()
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{env['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"env": env, "args": vars(args), "results": results}, f, indent=2)
+        print(f"\nSaved {path}")
+    if args.compare:
+        compare(results, args.compare, args.trace_memory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from src.profiling import count, observe
+
+_SINGLE = re.compile(r'Transaction description: "(.*)"')
+_BATCH_LINE = re.compile(r'^(\d+): "(.*)"$', re.M)
+# Numbered category list of the compact system prompt: "0=Travel; 1=Meals."
+_COMPACT_CATEGORY = re.compile(r"(\d+)=([^;]+?)(?=; |\.\n|\.$)")
+
+# Keyword -> category answers for the synthetic long-tail merchants
+STUB_KEYWORDS = {
+    "HARDWARE": "Hardware",
+    "MEDICALS": "Healthcare",
+    "CATERERS": "Meals",
+    "STATIONERS": "Office Supplies",
+    "ASSOCIATES": "Professional Services",
+    "PRINTERS": "Marketing",
+}
+
+class StubLLMClient:
+    """In-process stand-in for OllamaClient with a configurable delay.
+
+    Each call sleeps `latency` seconds plus `per_item` per description in
+    a batch prompt (times a lognormal jitter when `jitter` > 0), which
+    releases the GIL like a real HTTP wait, then answers from
+    STUB_KEYWORDS ("Other" otherwise). `failure_rate` makes that share of
+    calls raise, to exercise retries and fallbacks.
+
+    Compact-mode calls (a `system` prompt with numbered categories) are
+    answered with category ids. Token counts are estimated at four
+    characters per token, so prompt modes can be compared; a system prompt
+    repeated from the previous call is not counted again, as the server's
+    prefix cache would skip it.
+    """
+    def __init__(self, latency: float = 0.05, per_item: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 0, model: str = "stub"):
+        self.model = model
+        self.latency = latency
+        self.per_item = per_item
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._last_system: str | None = None
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def _answer(self, description: str) -> Dict[str, Any]:
+        upper = description.upper()
+        for keyword, category in STUB_KEYWORDS.items():
+            if keyword in upper:
+                return {"category": category, "confidence": 0.85, "reason": f"stub: {keyword.lower()}"}
+        return {"category": "Other", "confidence": 0.6, "reason": "stub: no keyword"}
+
+    def _compact(self, items: List[Any], system: str) -> Dict[str, Any]:
+        ids = {name: int(i) for i, name in _COMPACT_CATEGORY.findall(system)}
+        out = []
+        for i, d in items:
+            ans = self._answer(d)
+            out.append({"id": int(i), "c": ids.get(ans["category"], ids.get("Other", 0)), "p": ans["confidence"]})
+        return {"items": out}
+
+    def classify_json(self, prompt: str, system: str | None = None, schema: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        items = _BATCH_LINE.findall(prompt)
+        with self._lock:
+            self.calls += 1
+            factor = float(self._rng.lognormal(0.0, self.jitter)) if self.jitter > 0 else 1.0
+            fail = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+        delay = (self.latency + self.per_item * max(1, len(items))) * factor
+
+        count("llm_calls")
+        time.sleep(delay)
+        observe("llm_latency_s", delay)
+        if fail:
+            count("llm_errors")
+            raise RuntimeError("stub LLM failure")
+
+        if system is not None:
+            out = self._compact(items, system)
+        elif items:
+            out = {"items": [{"id": int(i), **self._answer(d)} for i, d in items]}
+        else:
+            m = _SINGLE.search(prompt)
+            out = self._answer(m.group(1) if m else "")
+        with self._lock:
+            fresh_system = "" if system == self._last_system else (system or "")
+            self._last_system = system
+        count("llm_prompt_tokens", (len(prompt) + len(fresh_system)) // 4)
+        count("llm_output_tokens", len(json.dumps(out)) // 4)
+        return out
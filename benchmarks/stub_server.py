@@ -0,0 +1,149 @@
+"""Ollama-compatible HTTP stub, for exercising the real OllamaClient
+(connection pool, circuit breaker, concurrency) without a model:
+
+    python -m benchmarks.stub_server --port 11435 --latency 0.05
+
+then point the app or `python -m src.pipeline --llm --url` at it.
+The checks in benchmarks/checks.py start one in-process on a free port.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.stub_llm import StubLLMClient, _BATCH_LINE
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK (~40 ms per keep-alive request)
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        stub = self.server.stub
+        if self.path in ("/api/tags", "/api/ps"):
+            self._send(200, {"models": [{"name": m} for m in stub.models]})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        stub = self.server.stub
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/generate":
+            self._send(404, {"error": "not found"})
+            return
+        status, body = stub.generate(payload)
+        self._send(status, body)
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubOllamaServer"
+
+class StubOllamaServer:
+    """Serves /api/tags, /api/ps and /api/generate on a background thread,
+    answering like StubLLMClient after `latency` seconds plus `per_item`
+    per description in a batch prompt.
+
+    While `fail` is set, /api/generate answers HTTP 503 (after the same
+    delay), which OllamaClient counts as a failure for its circuit breaker.
+    `requests` counts generate calls that reached the server and
+    `max_in_flight` the most handled at once.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05, per_item: float = 0.0, models: List[str] | None = None):
+        self.latency = latency
+        self.per_item = per_item
+        self.models = models or ["llama3.1:8b"]
+        self.fail = False
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._answers = StubLLMClient(latency=0.0)
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.max_in_flight = self.in_flight
+
+    def generate(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        prompt = payload.get("prompt", "")
+        system = payload.get("system")
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.fail
+        try:
+            time.sleep(self.latency + self.per_item * max(1, len(_BATCH_LINE.findall(prompt))))
+            if fail:
+                return 503, {"error": "stub server failing"}
+            out = json.dumps(self._answers.classify_json(prompt, system=system))
+            # Four characters per token, as StubLLMClient estimates
+            return 200, {
+                "model": payload.get("model"),
+                "response": out,
+                "done": True,
+                "prompt_eval_count": (len(prompt) + len(system or "")) // 4,
+                "eval_count": len(out) // 4,
+            }
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def start(self) -> "StubOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run an Ollama-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per generate call")
+    parser.add_argument("--per-item", type=float, default=0.0, help="Extra seconds per description in a batch")
+    parser.add_argument("--model", action="append", dest="models", help="Model name to list (repeatable)")
+    args = parser.parse_args(argv)
+
+    server = StubOllamaServer(args.host, args.port, args.latency, args.per_item, args.models)
+    print(f"Stub Ollama at {server.url} (Ctrl+C to stop)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Seeded synthetic bank-statement generator for benchmarks.
+
+Rows look like the files in sample_data/: "MERCHANT - Merchant text SUFFIX"
+descriptions, Indian amount formats (lakh grouping, ₹ / Rs. / INR, the "?"
+a mis-encoded ₹ turns into) and one date format per file. A share of rows
+come from a long tail of small merchants no rule matches, so the LLM tier
+has work to do. Duplicates and outliers are injected and marked in the
+`is_duplicate` / `is_outlier` columns (omitted from CSV output by default).
+"""
+import os
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# code, description text, category, typical amount (median, INR)
+MERCHANTS: List[Tuple[str, str, str, float]] = [
+    ("UBER", "Uber trip", "Travel", 450),
+    ("OLA", "Ola ride", "Travel", 380),
+    ("IRCTC", "IRCTC train booking", "Travel", 1800),
+    ("MAKEMYTRIP", "MakeMyTrip booking", "Travel", 9500),
+    ("GOIBIBO", "Goibibo booking", "Travel", 8200),
+    ("INDIGO", "IndiGo flight", "Travel", 6500),
+    ("VISTARA", "Vistara flight", "Travel", 7800),
+    ("SWIGGY", "Swiggy food order", "Meals", 550),
+    ("ZOMATO", "Zomato food order", "Meals", 600),
+    ("DOMINOS", "Dominos pizza", "Meals", 700),
+    ("KFC", "KFC meal", "Meals", 520),
+    ("STARBUCKS", "Starbucks coffee", "Meals", 420),
+    ("DMART", "DMart groceries", "Groceries", 2400),
+    ("BIGBASKET", "BigBasket groceries", "Groceries", 2100),
+    ("RELIANCE FRESH", "Reliance Fresh groceries", "Groceries", 1700),
+    ("AWS", "AWS cloud charges", "Software", 14000),
+    ("GOOGLE CLOUD", "Google Cloud billing", "Software", 12000),
+    ("MICROSOFT", "Microsoft 365", "Software", 3200),
+    ("ADOBE", "Adobe subscription", "Software", 4200),
+    ("NOTION", "Notion subscription", "Software", 1300),
+    ("ATLASSIAN", "Atlassian Jira", "Software", 5600),
+    ("GITHUB", "GitHub subscription", "Software", 1700),
+    ("ZOOM", "Zoom subscription", "Software", 1400),
+    ("SLACK", "Slack subscription", "Software", 2300),
+    ("ELECTRICITY", "Electricity bill", "Utilities", 3800),
+    ("WATER", "Water bill", "Utilities", 900),
+    ("GAS", "Gas bill", "Utilities", 1100),
+    ("AIRTEL", "Airtel broadband bill", "Utilities", 1200),
+    ("JIO", "Jio fiber bill", "Utilities", 1000),
+    ("AMAZON", "Amazon office supplies", "Office Supplies", 2600),
+    ("FLIPKART", "Flipkart office supplies", "Office Supplies", 2300),
+    ("META ADS", "Meta ads spend", "Marketing", 15000),
+    ("GOOGLE ADS", "Google ads spend", "Marketing", 18000),
+    ("HDFC", "HDFC bank charge", "Bank Fees", 250),
+    ("ICICI", "ICICI bank fee", "Bank Fees", 200),
+    ("SBI", "SBI service charge", "Bank Fees", 180),
+    ("NETFLIX", "Netflix subscription", "Entertainment", 650),
+    ("SPOTIFY", "Spotify subscription", "Entertainment", 120),
+    ("LEGAL", "Legal services", "Professional Services", 25000),
+    ("CA CONSULT", "CA consultation", "Professional Services", 12000),
+    ("FREELANCER", "Freelance services", "Professional Services", 18000),
+    ("NEFT", "NEFT transfer", "Transfers", 20000),
+    ("IMPS", "IMPS transfer", "Transfers", 8000),
+    ("UPI", "UPI transfer", "Transfers", 1500),
+]
+
+# Long-tail merchants: first x second x kind. The kind decides the category.
+_TAIL_FIRST = ["SHRI", "NEW", "JAI", "OM", "ROYAL", "CITY", "STAR"]
+_TAIL_SECOND = ["GANESH", "BALAJI", "KRISHNA", "LAXMI", "SAI", "DURGA"]
+_TAIL_KINDS = {
+    "HARDWARE": ("Hardware", 6500),
+    "MEDICALS": ("Healthcare", 900),
+    "CATERERS": ("Meals", 4500),
+    "STATIONERS": ("Office Supplies", 700),
+    "TRADERS": ("Other", 3000),
+    "ASSOCIATES": ("Professional Services", 15000),
+    "PRINTERS": ("Marketing", 5000),
+}
+
+SUFFIXES = ["MUM", "BLR", "DEL", "AHM", "HYD", "CHN", "PUN", "KOL", "UPI/{id}", "POS/{id}", "ONLINE/{id}", "{id}", "Ref {id}", "Txn {id}", "Payment {id}"]
+
+# prefix, suffix around the formatted number
+AMOUNT_STYLES = [("", ""), ("₹", ""), ("₹ ", ""), ("Rs. ", ""), ("", " INR"), ("INR ", ""), ("? ", "")]
+
+_ID_ALPHABET = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"))
+
+def tail_merchants() -> List[Tuple[str, str, str, float]]:
+    out = []
+    for first in _TAIL_FIRST:
+        for second in _TAIL_SECOND:
+            for kind, (category, median) in _TAIL_KINDS.items():
+                name = f"{first} {second} {kind}"
+                out.append((name, name.title(), category, median))
+    return out
+
+def indian_grouping(value: int) -> str:
+    """12345678 -> "1,23,45,678" (lakh / crore grouping)."""
+    s = str(value)
+    if len(s) <= 3:
+        return s
+    head, tail = s[:-3], s[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    return ",".join(groups) + "," + tail
+
+def format_amount(value: float, decimals: bool, style: Tuple[str, str]) -> str:
+    whole = int(value)
+    text = indian_grouping(whole)
+    if decimals:
+        text += f".{int(round((value - whole) * 100)) % 100:02d}"
+    return f"{style[0]}{text}{style[1]}"
+
+def generate_transactions(
+    n: int,
+    seed: int = 0,
+    date_format: str = "%d-%m-%Y",
+    start: str = "2024-01-01",
+    days: int = 365,
+    tail_share: float = 0.1,
+    duplicate_rate: float = 0.01,
+    outlier_rate: float = 0.005,
+) -> pd.DataFrame:
+    """n rows (plus injected duplicates) of date/amount/description text
+    columns, with truth columns `category`, `is_duplicate`, `is_outlier`."""
+    rng = np.random.default_rng(seed)
+    known, tail = MERCHANTS, tail_merchants()
+
+    from_tail = rng.random(n) < tail_share
+    pick = np.where(from_tail, rng.integers(0, len(tail), n), rng.integers(0, len(known), n))
+    table = [known, tail]
+    rows = [table[t][i] for t, i in zip(from_tail.astype(int).tolist(), pick.tolist())]
+
+    ids = _ID_ALPHABET[rng.integers(0, len(_ID_ALPHABET), (n, 6))].view("<U6").ravel()
+    suffix_idx = rng.integers(0, len(SUFFIXES), n)
+    descriptions = [
+        f"{code} - {text} {SUFFIXES[s].format(id=i)}"
+        for (code, text, _, _), s, i in zip(rows, suffix_idx.tolist(), ids.tolist())
+    ]
+
+    medians = np.array([r[3] for r in rows], dtype=float)
+    amounts = np.maximum(1.0, medians * rng.lognormal(0.0, 0.45, n))
+    is_outlier = rng.random(n) < outlier_rate
+    amounts[is_outlier] *= rng.uniform(15, 40, int(is_outlier.sum()))
+    with_decimals = rng.random(n) < 0.25
+    amounts = np.where(with_decimals, np.round(amounts, 2), np.round(amounts))
+    styles = rng.integers(0, len(AMOUNT_STYLES), n)
+    amount_text = [
+        format_amount(v, d, AMOUNT_STYLES[s])
+        for v, d, s in zip(amounts.tolist(), with_decimals.tolist(), styles.tolist())
+    ]
+
+    # Format each calendar day once rather than every row
+    day_labels = pd.date_range(start, periods=days, freq="D").strftime(date_format).to_numpy()
+    df = pd.DataFrame({
+        "date": day_labels[rng.integers(0, days, n)],
+        "amount": amount_text,
+        "description": descriptions,
+        "category": [r[2] for r in rows],
+        "is_duplicate": False,
+        "is_outlier": is_outlier,
+    })
+
+    # Duplicates are exact copies placed right after their original
+    n_dup = int(n * duplicate_rate)
+    if n_dup:
+        src = np.sort(rng.choice(n, n_dup, replace=False))
+        dups = df.iloc[src].assign(is_duplicate=True)
+        dups.index = src + 0.5
+        df = pd.concat([df, dups]).sort_index(kind="stable").reset_index(drop=True)
+    return df
+
+def write_csv(path: str, n: int, seed: int = 0, chunk_rows: int = 1_000_000, truth: bool = False, **kwargs) -> str:
+    """Write n (+ duplicates) rows to `path` chunk by chunk so 10M-row files
+    don't need 10M rows in memory. Chunk i is seeded with (seed, i)."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = path + ".tmp"
+    cols = None if truth else ["date", "amount", "description"]
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for i, start in enumerate(range(0, n, chunk_rows)):
+            size = min(chunk_rows, n - start)
+            chunk = generate_transactions(size, seed=int(np.random.SeedSequence([seed, i]).generate_state(1)[0]), **kwargs)
+            chunk.to_csv(f, columns=cols, index=False, header=(i == 0))
+    os.replace(tmp, path)
+    return path
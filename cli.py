@@ -0,0 +1,8 @@
+"""Command-line entry point for batch runs, e.g.
+
+    python cli.py sample_data/ --out output --workers 4
+"""
+from src.pipeline import main
+
+if __name__ == "__main__":
+    main()
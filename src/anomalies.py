@@ -1,8 +1,20 @@
 import numpy as np
 import pandas as pd
-from src.utils import normalize_for_match
+from typing import Dict
+from src.utils import normalize_for_match_column, map_unique, fingerprint_from_norm
+from src.baselines import AmountSketch, BaselineStore
+from src.duplicates import DuplicateIndex
+from src.profiling import profiled, count
+
+def mad_flags(series: pd.Series, k: float = 4.0, baseline: AmountSketch | None = None, include_batch: bool = True) -> pd.Series:
+    if baseline is not None:
+        # Score against stored history plus this batch (unless the history
+        # already holds it)
+        threshold = (baseline.copy().add(series.to_numpy()) if include_batch else baseline).threshold(k)
+        if threshold is None:
+            return pd.Series([False] * len(series), index=series.index)
+        return series > threshold
 
-def mad_flags(series: pd.Series, k: float = 4.0) -> pd.Series:
     x = series.dropna().values
     if len(x) < 10:
         return pd.Series([False] * len(series), index=series.index)
@@ -15,34 +27,153 @@ def mad_flags(series: pd.Series, k: float = 4.0) -> pd.Series:
     threshold = med + k * mad
     return series > threshold
 
-def detect_anomalies(df: pd.DataFrame, manual_high_threshold: float | None = None) -> pd.DataFrame:
+# Anomaly reasons are kept as bits in an integer column and only rendered to
+# text labels when displayed or exported.
+HIGH_STATISTICAL = 1
+HIGH_MANUAL = 2
+POSSIBLE_DUPLICATE = 4
+CATEGORY_OUTLIER = 8
+MERCHANT_OUTLIER = 16
+ARCHIVE_DUPLICATE = 32
+
+def group_mad_flags(amount: pd.Series, groups: pd.Series, k: float = 4.0) -> pd.Series:
+    """mad_flags() applied within each group using groupby transforms.
+
+    Same rule as mad_flags: groups with fewer than 10 values are never
+    flagged, and a zero MAD falls back to the std (or 1.0).
+    """
+    g = amount.groupby(groups)
+    n = g.transform("count")
+    med = g.transform("median")
+    mad = (amount - med).abs().groupby(groups).transform("median")
+    std = g.transform("std", ddof=0)
+    mad = mad.where(mad != 0, std.where(std > 0, 1.0))
+    return ((n >= 10) & (amount > med + k * mad)).fillna(False).astype(bool)
+
+def baseline_mad_flags(
+    amount: pd.Series,
+    groups: pd.Series,
+    history: Dict[str, AmountSketch],
+    k: float = 4.0,
+    include_batch: bool = True,
+) -> pd.Series:
+    """mad_flags() per group, scored against each group's stored sketch
+    merged with this batch (or alone, without `include_batch`). Rows with
+    a missing group are never flagged."""
+    keys = groups.astype(str).where(groups.notna())
+    thresholds: Dict[str, float] = {}
+    for key, values in amount.groupby(keys):
+        sk = history[key].copy() if key in history else AmountSketch()
+        if include_batch:
+            sk.add(values.to_numpy())
+        threshold = sk.threshold(k)
+        if threshold is not None:
+            thresholds[key] = threshold
+    limit = keys.map(thresholds).astype(float)
+    return (amount > limit).fillna(False).astype(bool)
+
+def duplicate_keys(df: pd.DataFrame) -> np.ndarray:
+    """64-bit key per row of (date, amount, desc_norm), the fields of the
+    in-batch duplicate check. Unlike that check's factorized codes these
+    are comparable across batches, e.g. the chunks of one file."""
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({"date": df["date"], "amount": df["amount"], "desc": df["desc_norm"]}),
+        index=False,
+    ).to_numpy()
+
+def render_anomaly_labels(flags: pd.Series, manual_high_threshold: float | None = None) -> pd.Series:
+    """Turn anomaly_flags bitmasks into the human-readable label strings."""
+    parts = [
+        (HIGH_STATISTICAL, "High amount (statistical); "),
+        (HIGH_MANUAL, f"High amount (> {manual_high_threshold}); "),
+        (POSSIBLE_DUPLICATE, "Possible duplicate; "),
+        (CATEGORY_OUTLIER, "Unusual for category; "),
+        (MERCHANT_OUTLIER, "Unusual for merchant; "),
+        (ARCHIVE_DUPLICATE, "Possible duplicate of earlier statement; "),
+    ]
+    # Only a handful of distinct bitmasks exist, so render each once
+    labels = {f: "".join(text for bit, text in parts if f & bit) for f in flags.unique()}
+    return flags.map(labels).astype(object)
+
+@profiled("anomalies")
+def detect_anomalies(
+    df: pd.DataFrame,
+    manual_high_threshold: float | None = None,
+    with_labels: bool = True,
+    baselines: BaselineStore | None = None,
+    update_baselines: bool = False,
+    dup_index: DuplicateIndex | None = None,
+    source: str = "upload",
+    update_dup_index: bool = False,
+    batch_key: str | None = None,
+    history_includes_batch: bool = False,
+) -> pd.DataFrame:
+    """Flag anomalies in `df`.
+
+    With a `baselines` store, amounts are scored against stored history
+    (overall, per category and per merchant fingerprint) merged with this
+    batch, and `update_baselines` folds the batch into the store afterwards;
+    with a `batch_key` (e.g. a hash of the upload) only the first time.
+    `history_includes_batch` scores against the stored sketches alone, for
+    a store that was already fed these rows (see pipeline._stream_file).
+    With a `dup_index`, rows are also checked against previously archived
+    statements (other than `source`), the match is recorded in
+    `duplicate_of`, and `update_dup_index` archives this batch.
+    """
     out = df.copy()
-    out["anomaly_labels"] = ""
+    flags = np.zeros(len(out), dtype=np.uint8)
 
     # Statistical high amounts across all expenses
-    high_all = mad_flags(out["amount"], k=4.0)
-    out.loc[high_all, "anomaly_labels"] += "High amount (statistical); "
+    history = baselines.get("all", ["*"]).get("*", AmountSketch()) if baselines is not None else None
+    include = not history_includes_batch
+    flags |= HIGH_STATISTICAL * mad_flags(out["amount"], k=4.0, baseline=history, include_batch=include).to_numpy(np.uint8)
 
     # Manual high amount threshold (user-defined)
     if manual_high_threshold is not None and manual_high_threshold > 0:
-        out.loc[out["amount"] > manual_high_threshold, "anomaly_labels"] += f"High amount (> {manual_high_threshold}); "
+        flags |= HIGH_MANUAL * (out["amount"] > manual_high_threshold).to_numpy(np.uint8)
 
-    # Possible duplicates
-    out["desc_norm"] = out["description"].fillna("").map(normalize_for_match)
-    key = out["date"].astype(str) + "|" + out["amount"].astype(str) + "|" + out["desc_norm"]
-    dup = key.duplicated(keep=False)
-    out.loc[dup, "anomaly_labels"] += "Possible duplicate; "
+    # Possible duplicates: same date, amount and normalized description.
+    # Reuse the ingest column when present instead of normalizing again.
+    desc_norm = out["desc_norm"] if "desc_norm" in out.columns else normalize_for_match_column(out["description"])
+    desc_codes, _ = pd.factorize(desc_norm, use_na_sentinel=False)
+    key = pd.util.hash_pandas_object(
+        pd.DataFrame({"date": out["date"], "amount": out["amount"], "desc": desc_codes}),
+        index=False,
+    )
+    flags |= POSSIBLE_DUPLICATE * key.duplicated(keep=False).to_numpy(np.uint8)
+
+    # Possible duplicates of rows in earlier uploads
+    if dup_index is not None:
+        out["duplicate_of"] = dup_index.find(out.assign(desc_norm=desc_norm), source)
+        flags |= ARCHIVE_DUPLICATE * out["duplicate_of"].notna().to_numpy(np.uint8)
+        if update_dup_index:
+            dup_index.add(out.assign(desc_norm=desc_norm), source)
 
     # Out-of-pattern within category (after categorization)
     if "category" in out.columns:
-        out["cat_outlier"] = False
-        for cat, g in out.groupby("category"):
-            flags = mad_flags(g["amount"], k=4.0)
-            out.loc[g.index, "cat_outlier"] = flags.values
-        out.loc[out["cat_outlier"], "anomaly_labels"] += "Unusual for category; "
-        out.drop(columns=["cat_outlier"], inplace=True, errors="ignore")
+        if baselines is not None:
+            history = baselines.get("category", out["category"].dropna().unique())
+            cat_flags = baseline_mad_flags(out["amount"], out["category"], history, k=4.0, include_batch=include)
+        else:
+            cat_flags = group_mad_flags(out["amount"], out["category"], k=4.0)
+        flags |= CATEGORY_OUTLIER * cat_flags.to_numpy(np.uint8)
+
+    # Out-of-pattern for the merchant; needs history to be meaningful
+    if baselines is not None:
+        merchant = map_unique(desc_norm, lambda n: fingerprint_from_norm(n or ""))
+        history = baselines.get("merchant", merchant.unique())
+        flags |= MERCHANT_OUTLIER * baseline_mad_flags(out["amount"], merchant, history, k=4.0, include_batch=include).to_numpy(np.uint8)
 
-    out["is_anomaly"] = out["anomaly_labels"].str.len().gt(0)
+        if update_baselines and (batch_key is None or baselines.claim_batch(batch_key)):
+            baselines.update("all", pd.Series("*", index=out.index), out["amount"])
+            if "category" in out.columns:
+                valid = out["category"].notna()
+                baselines.update("category", out.loc[valid, "category"], out.loc[valid, "amount"])
+            baselines.update("merchant", merchant, out["amount"])
 
-    out.drop(columns=["desc_norm"], inplace=True, errors="ignore")
-    return out
\ No newline at end of file
+    out["anomaly_flags"] = flags
+    if with_labels:
+        out["anomaly_labels"] = render_anomaly_labels(out["anomaly_flags"], manual_high_threshold)
+    out["is_anomaly"] = out["anomaly_flags"].gt(0)
+    count("anomalies", int(out["is_anomaly"].sum()))
+    return out
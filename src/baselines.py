@@ -0,0 +1,226 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+from src.utils import fingerprint_from_norm, map_unique
+
+# Relative accuracy of sketch quantiles (1%)
+SKETCH_ALPHA = 0.01
+
+class AmountSketch:
+    """Mergeable log-bucketed histogram of amounts (DDSketch-style).
+
+    Quantiles are accurate to SKETCH_ALPHA relative error, and the median
+    absolute deviation is derived from the same buckets, so a category's
+    MAD baseline can be kept up to date in O(new rows) without the raw
+    history. Count, sum and sum of squares are exact, for the std fallback.
+    Non-positive amounts share a single zero bucket.
+    """
+    def __init__(self, alpha: float = SKETCH_ALPHA):
+        self.alpha = alpha
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, values: Iterable[float]) -> "AmountSketch":
+        x = np.asarray(values, dtype=float)
+        x = x[~np.isnan(x)]
+        if x.size == 0:
+            return self
+        self.count += int(x.size)
+        self.total += float(x.sum())
+        self.total_sq += float(np.square(x).sum())
+
+        pos = x[x > 0]
+        self.zero_count += int(x.size - pos.size)
+        if pos.size:
+            idx, counts = np.unique(np.ceil(np.log(pos) / self._log_gamma).astype(np.int64), return_counts=True)
+            for i, c in zip(idx.tolist(), counts.tolist()):
+                self.buckets[i] = self.buckets.get(i, 0) + c
+        return self
+
+    def merge(self, other: "AmountSketch") -> "AmountSketch":
+        for i, c in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + c
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        return self
+
+    def copy(self) -> "AmountSketch":
+        return AmountSketch(self.alpha).merge(self)
+
+    def _values_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        idx = np.array(sorted(self.buckets), dtype=np.int64)
+        values = 2 * np.power(self._gamma, idx.astype(float)) / (self._gamma + 1)
+        counts = np.array([self.buckets[i] for i in idx.tolist()], dtype=np.int64)
+        if self.zero_count:
+            values = np.concatenate([[0.0], values])
+            counts = np.concatenate([[self.zero_count], counts])
+        return values, counts
+
+    @staticmethod
+    def _weighted_median(values: np.ndarray, counts: np.ndarray) -> float:
+        order = np.argsort(values, kind="stable")
+        cum = np.cumsum(counts[order])
+        return float(values[order][np.searchsorted(cum, cum[-1] / 2.0)])
+
+    def median(self) -> float:
+        values, counts = self._values_counts()
+        return self._weighted_median(values, counts) if counts.size else float("nan")
+
+    def median_mad(self) -> Tuple[float, float]:
+        values, counts = self._values_counts()
+        if not counts.size:
+            return float("nan"), float("nan")
+        med = self._weighted_median(values, counts)
+        return med, self._weighted_median(np.abs(values - med), counts)
+
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        mean = self.total / self.count
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
+
+    def threshold(self, k: float) -> float | None:
+        """Same rule as anomalies.mad_flags: None when fewer than 10 values."""
+        if self.count < 10:
+            return None
+        med, mad = self.median_mad()
+        if mad == 0:
+            std = self.std()
+            mad = std if std > 0 else 1.0
+        return med + k * mad
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "alpha": self.alpha,
+            "buckets": self.buckets,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "total_sq": self.total_sq,
+        })
+
+    @classmethod
+    def from_json(cls, text: str) -> "AmountSketch":
+        d = json.loads(text)
+        sk = cls(d["alpha"])
+        sk.buckets = {int(i): int(c) for i, c in d["buckets"].items()}
+        sk.zero_count = d["zero_count"]
+        sk.count = d["count"]
+        sk.total = d["total"]
+        sk.total_sq = d["total_sq"]
+        return sk
+
+class BaselineStore:
+    """Persistent per-scope amount sketches (e.g. per category, per merchant).
+
+    `scope` names the grouping ("all", "category", "merchant") and `key` the
+    group within it. Batches folded in under a key (e.g. an upload's hash)
+    are recorded, so the same batch is only counted once.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS amount_baselines (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                sketch TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (scope, key)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS folded_batches (
+                batch_key TEXT PRIMARY KEY,
+                folded_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def claim_batch(self, batch_key: str) -> bool:
+        """Record `batch_key` as folded in; False if it already was."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO folded_batches (batch_key, folded_at) VALUES (?, ?)",
+                (batch_key, time.time()),
+            )
+            self._conn.commit()
+            return cur.rowcount == 1
+
+    def get(self, scope: str, keys: Iterable[str]) -> Dict[str, AmountSketch]:
+        keys = list(dict.fromkeys(str(k) for k in keys))
+        found: Dict[str, AmountSketch] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, sketch FROM amount_baselines WHERE scope = ? AND key IN ({marks})",
+                    [scope, *part],
+                ).fetchall()
+                for key, sketch in rows:
+                    found[key] = AmountSketch.from_json(sketch)
+        return found
+
+    def update(self, scope: str, groups: pd.Series, amounts: pd.Series) -> None:
+        """Fold new amounts into the stored sketches of their groups."""
+        frame = pd.DataFrame({"key": groups.astype(str), "amount": amounts}).dropna()
+        if frame.empty:
+            return
+        grouped = {k: g.to_numpy() for k, g in frame.groupby("key")["amount"]}
+        sketches = self.get(scope, grouped)
+        now = time.time()
+        rows = []
+        for key, values in grouped.items():
+            sk = sketches.get(key) or AmountSketch()
+            rows.append((scope, key, sk.add(values).to_json(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO amount_baselines (scope, key, sketch, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def update_from_results(self, results, months: Iterable[str] | None = None) -> int:
+        """Fold rows of a ResultStore into the sketches; returns rows read."""
+        total = 0
+        for batch in results.iter_batches(columns=["amount", "category", "desc_norm"], months=months):
+            batch = batch[batch["amount"].notna()]
+            self.update("all", pd.Series("*", index=batch.index), batch["amount"])
+            self.update("category", batch["category"], batch["amount"])
+            merchant = map_unique(batch["desc_norm"], lambda n: fingerprint_from_norm(n or ""))
+            self.update("merchant", merchant, batch["amount"])
+            total += len(batch)
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM amount_baselines")
+            self._conn.execute("DELETE FROM folded_batches")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable
+
+class CategoryCache:
+    """Persistent SQLite cache of LLM categorization results.
+
+    Entries are keyed on a description key (normalized description) plus a
+    context string that callers derive from the model name, category list and
+    prompt version, so changing any of those simply stops matching old rows.
+    Old rows age out through TTL and least-recently-used eviction.
+    """
+    def __init__(self, path: str, max_entries: int = 100_000, ttl_seconds: float | None = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                desc_key TEXT NOT NULL,
+                context TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (desc_key, context)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str], context: str) -> Dict[str, Dict[str, Any]]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Dict[str, Any]] = {}
+        if not keys:
+            return found
+
+        now = time.time()
+        min_created = now - self.ttl_seconds if self.ttl_seconds else 0.0
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT desc_key, result FROM llm_cache WHERE context = ? AND created_at >= ? AND desc_key IN ({marks})",
+                    [context, min_created, *part],
+                ).fetchall()
+                for desc_key, result in rows:
+                    found[desc_key] = json.loads(result)
+            if found:
+                self._conn.executemany(
+                    "UPDATE llm_cache SET last_used = ? WHERE desc_key = ? AND context = ?",
+                    [(now, k, context) for k in found],
+                )
+                self._conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, Dict[str, Any]], context: str) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache (desc_key, context, result, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(k, context, json.dumps(v), now, now) for k, v in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE rowid IN (SELECT rowid FROM llm_cache ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
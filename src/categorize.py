@@ -1,56 +1,492 @@
+import hashlib
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, Tuple, List
+import pandas as pd
 from pydantic import BaseModel, Field, ValidationError
-from src.utils import normalize_for_match
+from src.utils import normalize_for_match, normalize_for_match_column, fingerprint_from_norm
+from src.rules import RuleIndex, RULE_REASON_PREFIX, get_rule_index
+from src.cache import CategoryCache
+from src.knn import KNNCategorizer
+from src.llm_client import DisabledLLMClient, LLMUnavailableError, ModelCascade
+from src.profiling import profiled, count, observe, submit
+
+# Bump when result validation or prompt handling changes in a way the prompt
+# templates themselves don't reflect, to invalidate cached LLM results.
+PROMPT_VERSION = 1
+
+# kNN answers below this confidence defer to the LLM; only rule hits and LLM
+# answers at or above KNN_LEARN_MIN_CONFIDENCE are learned from.
+KNN_MIN_CONFIDENCE = 0.8
+KNN_LEARN_MIN_CONFIDENCE = 0.8
 
 class LLMCategoryOut(BaseModel):
     category: str
     confidence: float = Field(..., ge=0, le=1)
-    reason: str = Field(..., max_length=180)
+    # Optional: short prompts for fast cascade tiers don't ask for one
+    reason: str = Field("", max_length=180)
+
+def rule_based_category(desc_norm: str, merchant_rules: Dict[str, str] | RuleIndex) -> Tuple[str, float, str] | None:
+    return get_rule_index(merchant_rules).match(desc_norm)
+
+def rule_based_categories(
+    descriptions: pd.Series,
+    merchant_rules: Dict[str, str] | RuleIndex,
+    categories: List[str],
+    desc_norm: pd.Series | None = None,
+) -> pd.DataFrame:
+    """Rule pass over a description column; misses get a null category."""
+    index = get_rule_index(merchant_rules)
+    if desc_norm is None:
+        desc_norm = normalize_for_match_column(descriptions)
+    out = index.match_series(desc_norm)
+    out["method"] = out["category"].where(out["category"].isna(), "rule")
 
-def rule_based_category(desc_norm: str, merchant_rules: Dict[str, str]) -> Tuple[str, float, str] | None:
-    for key, cat in merchant_rules.items():
-        if key in desc_norm:
-            return cat, 0.95, f"Matched rule: {key}"
-    return None
+    # Enforce category existence even for rules
+    unknown = out["category"].notna() & ~out["category"].isin(categories)
+    out.loc[unknown, ["category", "confidence", "reason", "method"]] = [
+        "Other", 0.4, "Rule mapped to unknown category; forced Other", "fallback"
+    ]
+    return out[["category", "confidence", "reason", "method"]]
 
-def build_prompt(description: str, categories: List[str]) -> str:
+def _reason_line(with_reason: bool) -> str:
+    return "\n- reason: short explanation <= 180 chars" if with_reason else ""
+
+def build_prompt(description: str, categories: List[str], with_reason: bool = True) -> str:
     cats = ", ".join(categories)
     return f"""
 You are an expense categorization engine.
 
 Return ONLY valid JSON (no extra keys, no markdown) with:
 - category: must be exactly one of [{cats}]
-- confidence: number between 0 and 1
-- reason: short explanation <= 180 chars
+- confidence: number between 0 and 1{_reason_line(with_reason)}
 
 Transaction description: "{description}"
 
 JSON:
 """.strip()
 
-def categorize_one(description: str, llm_client, categories: List[str], merchant_rules: Dict[str, str]) -> Dict[str, Any]:
-    desc_norm = normalize_for_match(description)
+def build_batch_prompt(descriptions: List[str], categories: List[str], with_reason: bool = True) -> str:
+    cats = ", ".join(categories)
+    lines = "\n".join(f'{i}: "{d}"' for i, d in enumerate(descriptions))
+    return f"""
+You are an expense categorization engine.
+
+Return ONLY valid JSON (no markdown) of the form {{"items": [...]}} with one item per transaction, each having:
+- id: the transaction number given below
+- category: must be exactly one of [{cats}]
+- confidence: number between 0 and 1{_reason_line(with_reason)}
+
+Transactions:
+{lines}
+
+JSON:
+""".strip()
+
+def build_compact_system(categories: List[str], with_reason: bool = False) -> str:
+    """Instructions for compact mode. They are identical on every call (and
+    sent as Ollama's system prompt), so the server can reuse the evaluated
+    prefix; only the transaction lines change."""
+    cats = "; ".join(f"{i}={c}" for i, c in enumerate(categories))
+    reason = ', "r": <reason, max 60 chars>' if with_reason else ""
+    return (
+        f"Classify bank transactions into expense categories. Categories: {cats}.\n"
+        f'Reply with JSON {{"items": [{{"id": <transaction id>, "c": <category id>, "p": <confidence 0-1>{reason}}}]}}, one item per transaction.'
+    )
 
+def build_compact_prompt(descriptions: List[str]) -> str:
+    return "\n".join(f'{i}: "{d}"' for i, d in enumerate(descriptions))
+
+def compact_schema(categories: List[str], with_reason: bool = False) -> Dict[str, Any]:
+    """JSON schema for Ollama's `format`, constraining output to the compact shape."""
+    item: Dict[str, Any] = {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer"},
+            "c": {"type": "integer", "minimum": 0, "maximum": len(categories) - 1},
+            "p": {"type": "number", "minimum": 0, "maximum": 1},
+        },
+        "required": ["id", "c", "p"],
+    }
+    if with_reason:
+        item["properties"]["r"] = {"type": "string", "maxLength": 60}
+    return {"type": "object", "properties": {"items": {"type": "array", "items": item}}, "required": ["items"]}
+
+def _from_compact(item: Any, categories: List[str]) -> Any:
+    # {"c": id, "p": conf, "r": reason} -> the LLMCategoryOut fields
+    if not isinstance(item, dict):
+        return item
+    c = item.get("c")
+    category = categories[c] if isinstance(c, int) and 0 <= c < len(categories) else None
+    return {"category": category, "confidence": item.get("p"), "reason": item.get("r") or ""}
+
+def cache_context(llm_client, categories: List[str], compact: bool = False, with_reason: bool = True) -> str:
+    """Cache namespace for LLM results: model, category list and prompts."""
+    model = getattr(llm_client, "model", type(llm_client).__name__)
+    # Rendering the templates with a placeholder picks up any prompt edit
+    if compact:
+        templates = build_compact_system(categories, with_reason) + build_compact_prompt(["{description}"])
+    else:
+        templates = build_prompt("{description}", categories) + build_batch_prompt(["{description}"], categories)
+        if not with_reason:
+            templates += "|no reasons"
+    payload = f"{PROMPT_VERSION}|{model}|{templates}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _rule_result(desc_norm: str, merchant_rules: Dict[str, str] | RuleIndex, categories: List[str]) -> Dict[str, Any] | None:
     rb = rule_based_category(desc_norm, merchant_rules)
-    if rb:
-        cat, conf, reason = rb
-        # Enforce category existence even for rules
-        if cat not in categories:
-            return {"category": "Other", "confidence": 0.4, "reason": "Rule mapped to unknown category; forced Other", "method": "fallback"}
-        return {"category": cat, "confidence": conf, "reason": reason, "method": "rule"}
+    if not rb:
+        return None
+    cat, conf, reason = rb
+    # Enforce category existence even for rules
+    if cat not in categories:
+        return {"category": "Other", "confidence": 0.4, "reason": "Rule mapped to unknown category; forced Other", "method": "fallback"}
+    return {"category": cat, "confidence": conf, "reason": reason, "method": "rule"}
 
-    prompt = build_prompt(description, categories)
-    try:
-        raw = llm_client.classify_json(prompt)
-    except Exception:
-        return {"category": "Other", "confidence": 0.2, "reason": "LLM call failed; defaulted to Other", "method": "fallback"}
+def _rule_key_kept(desc_norm: str, reason: str) -> bool:
+    # A hit on a token the fingerprint drops (UPI, NEFT, a city code) says
+    # nothing about the merchant the kNN tier would learn it under
+    key = reason[len(RULE_REASON_PREFIX):] if reason.startswith(RULE_REASON_PREFIX) else ""
+    return bool(key) and key in fingerprint_from_norm(desc_norm)
+
+def knn_learnable(desc_norm: str, result: Dict[str, Any]) -> bool:
+    """Whether a categorized row should be taught to the kNN tier: rule hits
+    whose keyword is part of the merchant fingerprint, and LLM answers of at
+    least KNN_LEARN_MIN_CONFIDENCE."""
+    if result["method"] == "rule":
+        return _rule_key_kept(desc_norm, str(result["reason"]))
+    return result["method"] == "llm" and result["confidence"] >= KNN_LEARN_MIN_CONFIDENCE
 
+def knn_learn_mask(frame: pd.DataFrame) -> pd.Series:
+    """knn_learnable() over a categorized frame (desc_norm, method, reason, confidence)."""
+    mask = (frame["method"] == "llm") & (frame["confidence"] >= KNN_LEARN_MIN_CONFIDENCE)
+    rule = frame["method"] == "rule"
+    if rule.any():
+        pairs = list(zip(frame.loc[rule, "desc_norm"].astype(str), frame.loc[rule, "reason"].astype(str)))
+        kept = {p: _rule_key_kept(*p) for p in set(pairs)}
+        mask.loc[rule] = [kept[p] for p in pairs]
+    return mask.astype(bool)
+
+def _llm_result(raw: Any, categories: List[str]) -> Dict[str, Any]:
     try:
+        if not isinstance(raw, dict):
+            raise TypeError("LLM output is not a JSON object")
         parsed = LLMCategoryOut(**raw)
-    except ValidationError:
+    except (ValidationError, TypeError):
         return {"category": "Other", "confidence": 0.2, "reason": "Invalid LLM output; defaulted to Other", "method": "fallback"}
 
     if parsed.category not in categories:
         return {"category": "Other", "confidence": min(parsed.confidence, 0.4), "reason": "Category not allowed; defaulted to Other", "method": "fallback"}
 
-    return {"category": parsed.category, "confidence": parsed.confidence, "reason": parsed.reason, "method": "llm"}
\ No newline at end of file
+    return {"category": parsed.category, "confidence": parsed.confidence, "reason": parsed.reason or "Categorized by LLM", "method": "llm"}
+
+def _knn_result(desc_norm: str, knn: KNNCategorizer, categories: List[str], min_confidence: float) -> Dict[str, Any] | None:
+    pred = knn.predict([desc_norm])[0]
+    return _knn_accept(pred, categories, min_confidence)
+
+def _knn_accept(pred: Tuple[str, float, str] | None, categories: List[str], min_confidence: float) -> Dict[str, Any] | None:
+    if pred is None:
+        return None
+    cat, conf, neighbour = pred
+    if conf < min_confidence or cat not in categories:
+        return None
+    return {"category": cat, "confidence": conf, "reason": f"Similar to known merchant: {neighbour}"[:180], "method": "knn"}
+
+def _llm_failed() -> Dict[str, Any]:
+    return {"category": "Other", "confidence": 0.2, "reason": "LLM call failed; defaulted to Other", "method": "fallback"}
+
+def _llm_unavailable() -> Dict[str, Any]:
+    return {"category": "Other", "confidence": 0.2, "reason": "LLM unavailable (circuit open); defaulted to Other", "method": "fallback"}
+
+def _llm_disabled() -> Dict[str, Any]:
+    return {"category": "Other", "confidence": 0.2, "reason": "LLM disabled", "method": "fallback"}
+
+def _classify_with_retry(llm_client, prompt: str, retries: int, backoff: float, **kwargs: Any) -> Any:
+    for attempt in range(retries + 1):
+        try:
+            return llm_client.classify_json(prompt, **kwargs)
+        except LLMUnavailableError:
+            # Circuit open: retrying would only wait out the backoff
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+            count("llm_retries")
+            time.sleep(backoff * (2 ** attempt))
+
+def _tiers(llm_client) -> List[Any]:
+    return llm_client.tiers if isinstance(llm_client, ModelCascade) else [llm_client]
+
+def _needs_escalation(res: Dict[str, Any], threshold: float) -> bool:
+    return res["method"] != "llm" or res["confidence"] < threshold
+
+def _prefer(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    # A valid low-confidence answer beats a failed escalation
+    return second if second["method"] == "llm" or first["method"] != "llm" else first
+
+def _count_methods(results: List[Dict[str, Any]]) -> None:
+    for method, n in Counter(r["method"] for r in results).items():
+        count(f"method_{method}", n)
+
+@profiled("categorize")
+def categorize_one(
+    description: str,
+    llm_client,
+    categories: List[str],
+    merchant_rules: Dict[str, str] | RuleIndex,
+    cache: CategoryCache | None = None,
+    knn: KNNCategorizer | None = None,
+    compact_prompts: bool = False,
+    llm_reasons: bool = True,
+) -> Dict[str, Any]:
+    res = _categorize_one(description, llm_client, categories, merchant_rules, cache, knn, compact_prompts, llm_reasons)
+    _count_methods([res])
+    return res
+
+def _categorize_one(
+    description: str,
+    llm_client,
+    categories: List[str],
+    merchant_rules: Dict[str, str] | RuleIndex,
+    cache: CategoryCache | None,
+    knn: KNNCategorizer | None,
+    compact_prompts: bool = False,
+    llm_reasons: bool = True,
+) -> Dict[str, Any]:
+    desc_norm = normalize_for_match(description)
+
+    rb = _rule_result(desc_norm, merchant_rules, categories)
+    if rb:
+        return rb
+
+    if knn is not None:
+        kb = _knn_result(desc_norm, knn, categories, KNN_MIN_CONFIDENCE)
+        if kb:
+            return kb
+
+    context = cache_context(llm_client, categories, compact_prompts, llm_reasons) if cache is not None else ""
+    if cache is not None:
+        cached = cache.get_many([desc_norm], context).get(desc_norm)
+        if cached:
+            count("cache_hits")
+            return cached
+        count("cache_misses")
+
+    tiers = _tiers(llm_client)
+    res: Dict[str, Any] | None = None
+    for t, client in enumerate(tiers):
+        last = t == len(tiers) - 1
+        if t:
+            count("llm_escalated")
+        tier_res = _categorize_llm_chunk([description], client, categories, 0, 0.0, last and llm_reasons, compact=compact_prompts)[0]
+        res = tier_res if res is None else _prefer(res, tier_res)
+        if last or not _needs_escalation(res, llm_client.escalate_below):
+            break
+
+    if cache is not None and res["method"] == "llm":
+        cache.put_many({desc_norm: res}, context)
+    return res
+
+def _categorize_llm_chunk(
+    descriptions: List[str],
+    llm_client,
+    categories: List[str],
+    retries: int,
+    backoff: float,
+    with_reason: bool = True,
+    tier: int | None = None,
+    compact: bool = False,
+) -> List[Dict[str, Any]]:
+    # No answer to parse: its placeholder reply fits neither the batch nor the compact shape
+    if isinstance(llm_client, DisabledLLMClient):
+        return [_llm_disabled() for _ in descriptions]
+    kwargs: Dict[str, Any] = {}
+    if compact:
+        # Always the multi-transaction shape, even for one description
+        prompt = build_compact_prompt(descriptions)
+        kwargs = {"system": build_compact_system(categories, with_reason), "schema": compact_schema(categories, with_reason)}
+    elif len(descriptions) == 1:
+        prompt = build_prompt(descriptions[0], categories, with_reason)
+    else:
+        prompt = build_batch_prompt(descriptions, categories, with_reason)
+    t0 = time.perf_counter()
+    try:
+        raw = _classify_with_retry(llm_client, prompt, retries, backoff, **kwargs)
+    except LLMUnavailableError:
+        return [_llm_unavailable() for _ in descriptions]
+    except Exception:
+        return [_llm_failed() for _ in descriptions]
+    finally:
+        if tier is not None:
+            observe(f"llm_tier{tier}_latency_s", time.perf_counter() - t0)
+
+    if len(descriptions) == 1 and not compact:
+        return [_llm_result(raw, categories)]
+
+    # Multi-transaction mode: match items back by id, anything missing is invalid
+    items = raw.get("items") if isinstance(raw, dict) else None
+    by_id: Dict[int, Any] = {}
+    if isinstance(items, list):
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("id"), int):
+                by_id.setdefault(item["id"], item)
+    if compact:
+        return [_llm_result(_from_compact(by_id.get(i), categories), categories) for i in range(len(descriptions))]
+    return [_llm_result(by_id.get(i), categories) for i in range(len(descriptions))]
+
+def _run_llm_tier(
+    texts: Dict[str, str],
+    llm_client,
+    categories: List[str],
+    batch_size: int,
+    max_workers: int,
+    retries: int,
+    backoff: float,
+    with_reason: bool = True,
+    tier: int | None = None,
+    compact: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    keys = list(texts)
+    size = max(1, int(batch_size))
+    chunks = [keys[i:i + size] for i in range(0, len(keys), size)]
+    count("llm_requests", len(chunks))
+    out: Dict[str, Dict[str, Any]] = {}
+    if not chunks:
+        return out
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        futures = {
+            submit(
+                pool,
+                _categorize_llm_chunk,
+                [texts[k] for k in chunk],
+                llm_client,
+                categories,
+                retries,
+                backoff,
+                with_reason,
+                tier,
+                compact,
+            ): chunk
+            for chunk in chunks
+        }
+        for fut in as_completed(futures):
+            for k, res in zip(futures[fut], fut.result()):
+                out[k] = res
+    return out
+
+@profiled("categorize")
+def categorize_batch(
+    descriptions: List[str],
+    llm_client,
+    categories: List[str],
+    merchant_rules: Dict[str, str] | RuleIndex,
+    max_workers: int = 4,
+    batch_size: int = 1,
+    retries: int = 2,
+    backoff: float = 0.5,
+    cache: CategoryCache | None = None,
+    canonicalize: bool = False,
+    desc_norm: List[str] | None = None,
+    knn: KNNCategorizer | None = None,
+    knn_min_confidence: float = KNN_MIN_CONFIDENCE,
+    knn_learn: bool = True,
+    compact_prompts: bool = False,
+    llm_reasons: bool = True,
+) -> List[Dict[str, Any]]:
+    """Categorize many descriptions; results are returned in input order.
+
+    Rule hits are resolved inline. Rule misses are deduplicated on their
+    normalized description (or, with `canonicalize`, on their merchant
+    fingerprint so one representative per merchant is classified), looked
+    up in `cache`, then offered to the `knn` tier, which answers when its
+    confidence reaches `knn_min_confidence`. The remaining unique ones are
+    sent to the LLM through a thread pool capped at `max_workers`
+    concurrent calls, `batch_size` descriptions per prompt, retrying failed
+    calls with exponential backoff. Per-request timeouts are the LLM
+    client's own (see OllamaClient.timeout). Pass `desc_norm` (e.g. the
+    ingest column) to skip normalizing again.
+
+    With a ModelCascade as `llm_client`, its first tier gets every LLM
+    description (short prompt, no reason asked) and each later tier only
+    those whose answer failed validation or fell below the cascade's
+    `escalate_below` confidence.
+
+    `compact_prompts` sends fixed instructions with numbered categories as
+    the system prompt, the descriptions as the prompt, and a JSON schema for
+    {"items": [{"id", "c", "p"}]} answers; `llm_reasons=False` stops asking
+    for reasons in either mode.
+
+    With `knn_learn`, rule hits and confident LLM answers from this batch
+    are added to `knn` afterwards.
+    """
+    rule_index = get_rule_index(merchant_rules)
+    if desc_norm is None:
+        desc_norm = normalize_for_match_column(pd.Series(descriptions, dtype=object)).tolist()
+    results: List[Dict[str, Any] | None] = [None] * len(descriptions)
+    # Rules run once per distinct normalized description
+    rule_hits: Dict[str, Dict[str, Any] | None] = {}
+    # dedup key -> row positions still needing the LLM
+    pending: Dict[str, List[int]] = {}
+    for i, norm in enumerate(desc_norm):
+        if norm not in rule_hits:
+            rule_hits[norm] = _rule_result(norm, rule_index, categories)
+        rb = rule_hits[norm]
+        if rb:
+            results[i] = dict(rb)
+        else:
+            key = fingerprint_from_norm(norm) if canonicalize else norm
+            pending.setdefault(key, []).append(i)
+
+    resolved: Dict[str, Dict[str, Any]] = {}
+    context = cache_context(llm_client, categories, compact_prompts, llm_reasons) if cache is not None else ""
+    if cache is not None and pending:
+        resolved.update(cache.get_many(pending.keys(), context))
+        count("cache_hits", len(resolved))
+        count("cache_misses", len(pending) - len(resolved))
+
+    if knn is not None and pending:
+        unresolved = [k for k in pending if k not in resolved]
+        preds = knn.predict([desc_norm[pending[k][0]] for k in unresolved])
+        for k, pred in zip(unresolved, preds):
+            kb = _knn_accept(pred, categories, knn_min_confidence)
+            if kb:
+                resolved[k] = kb
+
+    todo = [k for k in pending if k not in resolved]
+    fresh: Dict[str, Dict[str, Any]] = {}
+    tiers = _tiers(llm_client)
+    for t, client in enumerate(tiers):
+        if not todo:
+            break
+        last = t == len(tiers) - 1
+        if len(tiers) > 1:
+            count(f"llm_tier{t}_rows", len(todo))
+        # First occurrence stands in for every row with the same key
+        answers = _run_llm_tier(
+            {k: descriptions[pending[k][0]] for k in todo}, client, categories,
+            batch_size, max_workers, retries, backoff,
+            with_reason=last and llm_reasons, tier=t if len(tiers) > 1 else None, compact=compact_prompts,
+        )
+        for k, res in answers.items():
+            fresh[k] = _prefer(fresh[k], res) if k in fresh else res
+        if not last:
+            todo = [k for k in todo if _needs_escalation(fresh[k], llm_client.escalate_below)]
+            count("llm_escalated", len(todo))
+    resolved.update(fresh)
+
+    if cache is not None:
+        cache.put_many({k: v for k, v in fresh.items() if v["method"] == "llm"}, context)
+
+    if knn is not None and knn_learn:
+        learn = [(norm, r["category"]) for norm, r in rule_hits.items() if r and knn_learnable(norm, r)]
+        learn += [(desc_norm[pending[k][0]], r["category"]) for k, r in fresh.items() if knn_learnable(desc_norm[pending[k][0]], r)]
+        if learn:
+            knn.learn([n for n, _ in learn], [c for _, c in learn])
+
+    for k, rows in pending.items():
+        for i in rows:
+            results[i] = dict(resolved[k])
+
+    _count_methods(results)
+    return results
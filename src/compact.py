@@ -0,0 +1,119 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.profiling import profiled
+from src.utils import normalize_for_match_column
+
+# Columns only needed while parsing; kept in exports of the full pipeline
+RAW_COLUMNS = ["amount_raw", "date_raw", "row_valid"]
+# Low-cardinality text: stored as integer codes into a dictionary of values
+CODED_COLUMNS = ["category", "method", "reason", "anomaly_labels", "duplicate_of"]
+# Descriptions are split into a coded head and trailing reference token
+DESC_HEAD = "description_head"
+DESC_REF = "description_ref"
+DERIVED_COLUMNS = ["desc_norm"]
+# Amounts are stored as integer cents, int32 while they fit
+AMOUNT_CENTS = "amount_cents"
+INT32_CENTS_LIMIT = 2 ** 31 - 1
+# Working columns kept out of CSV exports
+INTERNAL_COLUMNS = ["desc_norm", "anomaly_flags"]
+
+def memory_per_row(df: pd.DataFrame) -> float:
+    """Bytes per row, counting string payloads and category dictionaries."""
+    return float(df.memory_usage(deep=True, index=True).sum()) / max(1, len(df))
+
+def _split_descriptions(desc: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    # Split once per distinct description; missing values stay missing
+    codes, uniques = pd.factorize(desc)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.rpartition(" ")
+    split = (parts[1] == " ") & parts[2].str.contains(r"\d", regex=True)
+    head = np.append(np.where(split, parts[0], uniques).astype(object), None)
+    ref = np.append(np.where(split, parts[2], "").astype(object), None)
+    return (
+        pd.Series(pd.Categorical(head[codes]), index=desc.index),
+        pd.Series(pd.Categorical(ref[codes]), index=desc.index),
+    )
+
+def _join_descriptions(head: pd.Series, ref: pd.Series) -> pd.Series:
+    head = head.astype("category")
+    ref = ref.astype("category")
+    # Missing values (code -1) index the trailing None entries
+    heads = np.append(head.cat.categories.to_numpy(object), None)
+    refs = np.append(ref.cat.categories.to_numpy(object), None)
+    h = np.where(head.cat.codes < 0, len(heads) - 1, head.cat.codes).astype(np.int64)
+    r = np.where(ref.cat.codes < 0, len(refs) - 1, ref.cat.codes).astype(np.int64)
+    # Join once per distinct (head, ref) pair
+    pairs, inverse = np.unique(h * len(refs) + r, return_inverse=True)
+    joined = []
+    for pair in pairs:
+        hv, rv = heads[pair // len(refs)], refs[pair % len(refs)]
+        joined.append(f"{hv} {rv}" if hv is not None and rv else hv)
+    return pd.Series(np.array(joined, dtype=object)[inverse.ravel()], index=head.index, dtype=object)
+
+def _cents(amount: pd.Series) -> pd.Series | None:
+    """`amount` as integer cents, or None unless every value round-trips exactly."""
+    values = amount.to_numpy(np.float64)
+    if not np.isfinite(values).all():
+        return None
+    cents = np.rint(values * 100)
+    if (cents / 100 != values).any():
+        return None
+    dtype = np.int32 if np.abs(cents).max(initial=0) <= INT32_CENTS_LIMIT else np.int64
+    return pd.Series(cents.astype(dtype), index=amount.index)
+
+@profiled("compact")
+def compact_results(df: pd.DataFrame, drop_raw: bool = True) -> pd.DataFrame:
+    """Smaller in-memory copy of a result frame; see expand_results()."""
+    drop = [c for c in RAW_COLUMNS if c in df.columns] if drop_raw else []
+    if "description" in df.columns:
+        drop += [c for c in DERIVED_COLUMNS if c in df.columns]
+    out = df.drop(columns=drop)
+    for col in CODED_COLUMNS:
+        if col in out.columns and out[col].dtype != "category":
+            out[col] = out[col].astype("category")
+    if "confidence" in out.columns:
+        out["confidence"] = out["confidence"].astype(np.float32)
+    cols = {}
+    for col in out.columns:
+        if col == "description":
+            cols[DESC_HEAD], cols[DESC_REF] = _split_descriptions(out[col])
+        elif col == "amount" and (cents := _cents(out[col])) is not None:
+            cols[AMOUNT_CENTS] = cents
+        else:
+            cols[col] = out[col]
+    return pd.DataFrame(cols, index=out.index)
+
+def expand_results(df: pd.DataFrame) -> pd.DataFrame:
+    """Full columns of a compact_results() frame; other frames are returned as they are."""
+    if AMOUNT_CENTS not in df.columns and DESC_HEAD not in df.columns:
+        return df
+    cols = {}
+    for col in df.columns:
+        if col == AMOUNT_CENTS:
+            cols["amount"] = result_amounts(df)
+        elif col == DESC_HEAD:
+            cols["description"] = _join_descriptions(df[DESC_HEAD], df[DESC_REF])
+            cols["desc_norm"] = normalize_for_match_column(cols["description"])
+        elif col != DESC_REF:
+            cols[col] = df[col]
+    return pd.DataFrame(cols, index=df.index)
+
+def export_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows as written to CSV: full columns, without INTERNAL_COLUMNS."""
+    out = expand_results(df)
+    return out.drop(columns=[c for c in INTERNAL_COLUMNS if c in out.columns])
+
+def result_amounts(df: pd.DataFrame) -> pd.Series:
+    """Amounts as float64, from a full or compact_results() frame."""
+    if AMOUNT_CENTS in df.columns:
+        return (df[AMOUNT_CENTS] / 100).rename("amount")
+    return df["amount"]
+
+def expand_columns(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Turn categorical `columns` back into plain values."""
+    for col in columns:
+        if col in df.columns and df[col].dtype == "category":
+            df[col] = df[col].astype(object)
+    return df
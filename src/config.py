@@ -71,4 +71,50 @@ DEFAULT_MERCHANT_RULES = {
     "NEFT": "Transfers",
     "IMPS": "Transfers",
     "RTGS": "Transfers",
-}
\ No newline at end of file
+}
+
+# Persistent cache of LLM categorizations (see src/cache.py)
+LLM_CACHE_PATH = ".cache/llm_categories.sqlite"
+LLM_CACHE_MAX_ENTRIES = 100_000
+LLM_CACHE_TTL_DAYS = 90
+
+# Ollama connection (see src/llm_client.py): how long the server keeps the
+# model loaded after a call, the connect timeout, and the circuit breaker
+# (consecutive failures before falling back without calling, and the wait
+# before trying again)
+LLM_KEEP_ALIVE = "30m"
+LLM_CONNECT_TIMEOUT_S = 3
+LLM_BREAKER_FAILURES = 5
+LLM_BREAKER_COOLDOWN_S = 30
+
+# Model cascade (see llm_client.ModelCascade): answers from the fast model
+# below this confidence, or that fail validation, go to the main model
+LLM_ESCALATE_BELOW = 0.7
+
+# Persisted amount baselines for anomaly detection (see src/baselines.py)
+BASELINES_PATH = ".cache/anomaly_baselines.sqlite"
+
+# Archive of past transactions for cross-file duplicate checks (see src/duplicates.py)
+DUPLICATE_INDEX_PATH = ".cache/duplicate_index.sqlite"
+
+# Nearest-neighbour categorizer learned from past results (see src/knn.py)
+KNN_PATH = ".cache/knn_categorizer.npz"
+
+# Partitioned Parquet store of categorized results (see src/store.py)
+RESULTS_STORE_PATH = "output/results"
+
+# Watch-folder mode (see src/watch.py): seconds between scans, and how long
+# a file must go unmodified before it is read (so half-written exports wait)
+WATCH_POLL_S = 5
+WATCH_SETTLE_S = 2
+
+# Streamlit stage caches (app.py): entries kept per cached stage, their
+# lifetime, and the upload size above which results stay in the session
+# only instead of the shared cache
+APP_CACHE_MAX_ENTRIES = 8
+APP_CACHE_TTL_S = 3600
+APP_CACHE_MAX_UPLOAD_MB = 50
+
+# Memory budget for compacted result frames (see src/compact.py); measured
+# by `python -m benchmarks.run --stages compact`
+COMPACT_TARGET_BYTES_PER_ROW = 120
\ No newline at end of file
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+from difflib import SequenceMatcher
+
+import pandas as pd
+from src.utils import fingerprint_from_norm, map_unique, normalize_for_match_column
+
+_EPOCH = pd.Timestamp("1970-01-01")
+
+class DuplicateIndex:
+    """Persistent index of past transactions for cross-file duplicate checks.
+
+    Rows are bucketed by amount (in cents) and day, so each incoming row is
+    compared only with archived rows of the same amount within
+    +/- `window_days`. A candidate counts as a duplicate when its merchant
+    fingerprint matches or its normalized description is at least
+    `similarity` similar (difflib ratio), which tolerates small edits.
+    Rows from the same source are never matched with each other; the
+    in-file check in detect_anomalies covers those.
+    """
+    def __init__(self, path: str, window_days: int = 1, similarity: float = 0.85):
+        self.path = path
+        self.window_days = window_days
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dup_index (
+                row_key INTEGER PRIMARY KEY,
+                amount_cents INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                desc_norm TEXT NOT NULL,
+                merchant TEXT NOT NULL,
+                source TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_dup_bucket ON dup_index(amount_cents, day)")
+        self._conn.commit()
+
+    @staticmethod
+    def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+        desc_norm = df["desc_norm"] if "desc_norm" in df.columns else normalize_for_match_column(df["description"])
+        # Indexed by row position in df
+        keys = pd.DataFrame({
+            "amount_cents": (df["amount"] * 100).round().to_numpy(),
+            "day": (df["date"] - _EPOCH).dt.days.to_numpy(),
+            "desc_norm": desc_norm.fillna("").to_numpy(),
+        })
+        keys = keys.dropna(subset=["amount_cents", "day"])
+        keys["amount_cents"] = keys["amount_cents"].astype("int64")
+        keys["day"] = keys["day"].astype("int64")
+        keys["merchant"] = map_unique(keys["desc_norm"], lambda n: fingerprint_from_norm(n or ""))
+        return keys
+
+    def find(self, df: pd.DataFrame, source: str) -> pd.Series:
+        """Return, per row, "source (YYYY-MM-DD)" of an archived duplicate or None."""
+        found: list = [None] * len(df)
+        keys = self._prepare(df)
+        if keys.empty:
+            return pd.Series(found, index=df.index, dtype=object)
+
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (pos INTEGER, amount_cents INTEGER, day INTEGER)")
+            self._conn.execute("DELETE FROM incoming")
+            self._conn.executemany(
+                "INSERT INTO incoming VALUES (?, ?, ?)",
+                zip(range(len(keys)), keys["amount_cents"].tolist(), keys["day"].tolist()),
+            )
+            candidates = self._conn.execute(
+                """
+                SELECT i.pos, d.desc_norm, d.merchant, d.source, d.day
+                FROM incoming i
+                JOIN dup_index d
+                  ON d.amount_cents = i.amount_cents
+                 AND d.day BETWEEN i.day - ? AND i.day + ?
+                WHERE d.source != ?
+                """,
+                (self.window_days, self.window_days, source),
+            ).fetchall()
+            self._conn.execute("DELETE FROM incoming")
+
+        desc = keys["desc_norm"].tolist()
+        merchant = keys["merchant"].tolist()
+        rows = keys.index.tolist()
+        for pos, cand_desc, cand_merchant, cand_source, cand_day in candidates:
+            row = rows[pos]
+            if found[row] is not None:
+                continue
+            if cand_merchant == merchant[pos] or SequenceMatcher(None, cand_desc, desc[pos]).ratio() >= self.similarity:
+                found[row] = f"{cand_source} ({(_EPOCH + pd.Timedelta(days=cand_day)).date()})"
+        return pd.Series(found, index=df.index, dtype=object)
+
+    def add(self, df: pd.DataFrame, source: str) -> int:
+        """Archive rows of `df` under `source`; re-adding the same rows is a no-op."""
+        keys = self._prepare(df)
+        if keys.empty:
+            return 0
+        # Repeated identical rows within a source are kept apart by occurrence;
+        # the 64-bit row hash is stored as a signed SQLite integer key.
+        occurrence = keys.groupby(["amount_cents", "day", "desc_norm"]).cumcount()
+        row_key = pd.util.hash_pandas_object(
+            keys[["amount_cents", "day", "desc_norm"]].assign(occurrence=occurrence, source=source),
+            index=False,
+        ).to_numpy().view("int64")
+        rows = zip(
+            row_key.tolist(),
+            keys["amount_cents"].tolist(),
+            keys["day"].tolist(),
+            keys["desc_norm"].tolist(),
+            keys["merchant"].tolist(),
+            [source] * len(keys),
+        )
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO dup_index (row_key, amount_cents, day, desc_norm, merchant, source) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM dup_index")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
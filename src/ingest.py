@@ -1,38 +1,105 @@
 import pandas as pd
-from src.utils import normalize_text
+from typing import Iterator
+from src.utils import normalize_text_column, normalize_for_match_column
+from src.parsers import parse_amounts, parse_dates, detect_date_format
+from src.profiling import profiled, stage, count
 
 REQUIRED_COLS = ["date", "amount", "description"]
+DEFAULT_CHUNK_SIZE = 100_000
 
-def ingest_csv(file) -> pd.DataFrame:
-    try:
-        df = pd.read_csv(file)
-    except Exception as e:
-        raise ValueError(f"Could not read CSV: {e}")
-
+def check_columns(df: pd.DataFrame) -> None:
     df.columns = [c.strip().lower() for c in df.columns]
 
     missing = [c for c in REQUIRED_COLS if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}. Required: {REQUIRED_COLS}")
 
-    df["description"] = df["description"].apply(normalize_text)
+def clean_frame(df: pd.DataFrame, date_format: str | None = None, dayfirst: bool = True, decimal: str = ".") -> pd.DataFrame:
+    """Normalize, parse and validate a raw frame in place; returns it.
+
+    The date format is detected once for the frame unless given.
+    """
+    check_columns(df)
+
+    # Normalize once here; categorization and anomaly detection reuse desc_norm
+    df["description"] = normalize_text_column(df["description"])
+    df["desc_norm"] = normalize_for_match_column(df["description"])
 
-    # Clean amount: remove commas + currency symbols
     df["amount_raw"] = df["amount"]
-    df["amount"] = (
-        df["amount"]
-        .astype(str)
-        .str.replace(",", "", regex=False)
-        .str.replace("₹", "", regex=False)
-        .str.replace("$", "", regex=False)
-        .str.replace("INR", "", regex=False)
-        .str.replace("Rs.", "", regex=False)
-        .str.strip()
-    )
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    df["amount"] = parse_amounts(df["amount"], decimal=decimal)
 
     df["date_raw"] = df["date"]
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["date"] = parse_dates(df["date"], date_format=date_format, dayfirst=dayfirst)
 
     df["row_valid"] = df["date"].notna() & df["amount"].notna() & df["description"].ne("")
-    return df
\ No newline at end of file
+    return df
+
+@profiled("ingest")
+def ingest_csv(file, dayfirst: bool = True, decimal: str = ".") -> pd.DataFrame:
+    try:
+        df = pd.read_csv(file)
+    except Exception as e:
+        raise ValueError(f"Could not read CSV: {e}")
+
+    count("rows_ingested", len(df))
+    return clean_frame(df, dayfirst=dayfirst, decimal=decimal)
+
+def _pyarrow_chunks(file, chunk_size: int) -> Iterator[pd.DataFrame]:
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        raise ValueError("engine='pyarrow' requires the pyarrow package")
+
+    # pyarrow batches by bytes; ~128 bytes per statement row keeps batches
+    # close to the requested row count. Every column is read as text.
+    header = pacsv.open_csv(file, read_options=pacsv.ReadOptions(block_size=1 << 16))
+    names = header.schema.names
+    header.close()
+    if hasattr(file, "seek"):
+        file.seek(0)
+    reader = pacsv.open_csv(
+        file,
+        read_options=pacsv.ReadOptions(block_size=max(1 << 16, chunk_size * 128)),
+        convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names}),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+def iter_ingest_csv(
+    file,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    engine: str | None = None,
+    dayfirst: bool = True,
+    decimal: str = ".",
+) -> Iterator[pd.DataFrame]:
+    """Stream a CSV as cleaned chunks with the same columns and `row_valid`
+    semantics as `ingest_csv`, so memory stays bounded by `chunk_size`.
+
+    All input columns are read as text (amount and date are parsed during
+    cleaning anyway), which keeps dtypes stable from chunk to chunk. The row
+    index continues across chunks.
+    """
+    try:
+        if engine == "pyarrow":
+            chunks = _pyarrow_chunks(file, chunk_size)
+        else:
+            chunks = pd.read_csv(file, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[""], engine=engine)
+        offset = 0
+        date_format = None
+        for chunk in chunks:
+            if offset == 0:
+                # Detect the date format once on the first chunk and pin it
+                # so later chunks parse with the same explicit format.
+                check_columns(chunk)
+                date_format = detect_date_format(chunk["date"], dayfirst=dayfirst)
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            count("rows_ingested", len(chunk))
+            with stage("ingest"):
+                cleaned = clean_frame(chunk, date_format=date_format, dayfirst=dayfirst, decimal=decimal)
+            yield cleaned
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Could not read CSV: {e}")
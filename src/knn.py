@@ -0,0 +1,128 @@
+import os
+import threading
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.utils import fingerprint_from_norm
+
+class KNNCategorizer:
+    """Nearest-neighbour categorizer over hashed character n-grams.
+
+    Each known merchant fingerprint is stored as an L2-normalized vector of
+    hashed character n-gram counts in a dense NumPy matrix, so a lookup is
+    one matrix product. Confidence is the best cosine similarity scaled by
+    the share of the top `k` neighbours (similarity-weighted) agreeing with
+    the winning category. Training is incremental: learn() adds or relabels
+    fingerprints, and the oldest ones are dropped past `max_items`.
+    One instance may be shared between threads (the app caches it across
+    sessions), so learn, predict and save hold a lock.
+    """
+    def __init__(self, dims: int = 1024, ngram: int = 3, k: int = 5, max_items: int = 50_000):
+        self.dims = dims
+        self.ngram = ngram
+        self.k = k
+        self.max_items = max_items
+        self.keys: List[str] = []
+        self.labels: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dims), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.keys)
+
+    def vectorize(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dims), dtype=np.float32)
+        n = self.ngram
+        for row, text in enumerate(texts):
+            padded = f" {text} "
+            grams = [padded[i:i + n] for i in range(max(1, len(padded) - n + 1))]
+            # crc32 rather than hash() so vectors are stable across processes
+            idx = [zlib.crc32(g.encode("utf-8")) % self.dims for g in grams]
+            np.add.at(out[row], idx, 1.0)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+    def learn(self, desc_norm: List[str], categories: List[str]) -> None:
+        pairs = [(fingerprint_from_norm(norm), cat) for norm, cat in zip(desc_norm, categories)]
+        with self._lock:
+            new: Dict[str, str] = {}
+            for key, cat in pairs:
+                if not key:
+                    continue
+                if key in self._index:
+                    self.labels[self._index[key]] = cat
+                else:
+                    new[key] = cat
+            if new:
+                self._matrix = np.vstack([self._matrix, self.vectorize(list(new))])
+                self.keys.extend(new)
+                self.labels.extend(new.values())
+            if len(self.keys) > self.max_items:
+                drop = len(self.keys) - self.max_items
+                self._matrix = self._matrix[drop:]
+                self.keys = self.keys[drop:]
+                self.labels = self.labels[drop:]
+            self._index = {k: i for i, k in enumerate(self.keys)}
+
+    def predict(self, desc_norm: List[str], batch: int = 256) -> List[Tuple[str, float, str] | None]:
+        """(category, confidence, nearest fingerprint) per description, or None."""
+        # Snapshot under the lock; learn() rebinds the matrix and key list
+        # and relabels in place, so the copies stay consistent with each other
+        with self._lock:
+            matrix = self._matrix
+            keys = list(self.keys)
+            labels = np.array(self.labels, dtype=object)
+        if not keys or not desc_norm:
+            return [None] * len(desc_norm)
+        k = min(self.k, len(keys))
+        out: List[Tuple[str, float, str] | None] = []
+        queries = [fingerprint_from_norm(n) for n in desc_norm]
+        for start in range(0, len(queries), batch):
+            sims = self.vectorize(queries[start:start + batch]) @ matrix.T
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            for row, cand in enumerate(top):
+                cand_sims = np.clip(sims[row, cand], 0.0, None)
+                best = cand[np.argmax(cand_sims)]
+                best_sim = float(sims[row, best])
+                if best_sim <= 0:
+                    out.append(None)
+                    continue
+                cat = labels[best]
+                agree = cand_sims[labels[cand] == cat].sum() / cand_sims.sum()
+                out.append((cat, round(best_sim * float(agree), 4), keys[best]))
+        return out
+
+    def save(self, path: str) -> None:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = path + ".tmp.npz"
+        with self._lock:
+            np.savez_compressed(
+                tmp,
+                matrix=self._matrix,
+                keys=np.array(self.keys, dtype=str),
+                labels=np.array(self.labels, dtype=str),
+                params=np.array([self.dims, self.ngram, self.k, self.max_items]),
+            )
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "KNNCategorizer":
+        data = np.load(path, allow_pickle=False)
+        dims, ngram, k, max_items = (int(v) for v in data["params"])
+        knn = cls(dims=dims, ngram=ngram, k=k, max_items=max_items)
+        knn._matrix = data["matrix"].astype(np.float32)
+        knn.keys = data["keys"].tolist()
+        knn.labels = data["labels"].tolist()
+        knn._index = {key: i for i, key in enumerate(knn.keys)}
+        return knn
+
+    @classmethod
+    def load_or_new(cls, path: str) -> "KNNCategorizer":
+        return cls.load(path) if os.path.exists(path) else cls()
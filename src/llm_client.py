@@ -1,23 +1,179 @@
 import requests
 import json
-from typing import Dict, Any
+import threading
+import time
+from typing import Dict, Any, List
+from requests.adapters import HTTPAdapter
+from src.config import LLM_KEEP_ALIVE, LLM_CONNECT_TIMEOUT_S, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_S
+from src.profiling import count, observe
+
+def _account(body: Dict[str, Any]) -> None:
+    # Ollama reports token counts and nanosecond timings with each response
+    count("llm_prompt_tokens", int(body.get("prompt_eval_count") or 0))
+    count("llm_output_tokens", int(body.get("eval_count") or 0))
+    for key, name in (("load_duration", "llm_load_s"), ("prompt_eval_duration", "llm_prompt_eval_s"), ("eval_duration", "llm_eval_s")):
+        if body.get(key):
+            observe(name, body[key] / 1e9)
+
+class LLMUnavailableError(RuntimeError):
+    """Raised without contacting the server while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; while open, calls fail
+    immediately. After `cooldown_s` one trial call is let through: success
+    closes the breaker, failure opens it for another cooldown."""
+    def __init__(self, threshold: int = 5, cooldown_s: float = 30):
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.cooldown_s:
+                self._trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    count("llm_circuit_opened")
+                self.opened_at = time.monotonic()
+                self._trial = False
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3.1:8b"):
+    """Ollama /api/generate client.
+
+    Requests share one pooled keep-alive session (`pool_size` connections,
+    at least the number of concurrent callers). `keep_alive` is passed to
+    Ollama so the model stays loaded between calls; preload() loads it up
+    front. Connection errors, timeouts and HTTP errors feed a circuit
+    breaker, so when the server is down callers fall back after
+    `breaker_threshold` failures instead of each waiting out its own.
+    """
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        model: str = "llama3.1:8b",
+        timeout: float = 90,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT_S,
+        keep_alive: str | None = LLM_KEEP_ALIVE,
+        pool_size: int = 16,
+        breaker_threshold: int = LLM_BREAKER_FAILURES,
+        breaker_cooldown_s: float = LLM_BREAKER_COOLDOWN_S,
+    ):
         self.base_url = base_url.rstrip("/")
         self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.keep_alive = keep_alive
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown_s)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _gate(self) -> None:
+        if not self.breaker.allow():
+            count("llm_short_circuits")
+            raise LLMUnavailableError(f"LLM at {self.base_url} is unavailable (circuit open)")
+
+    def _post(self, path: str, payload: Dict[str, Any], timeout: float) -> requests.Response:
+        try:
+            r = self.session.post(f"{self.base_url}{path}", json=payload, timeout=(self.connect_timeout, timeout))
+            r.raise_for_status()
+        except Exception:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return r
 
-    def classify_json(self, prompt: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/api/generate"
+    def health(self, timeout: float = 3) -> Dict[str, Any]:
+        """Probe the server: is it up, is the model pulled, is it loaded?"""
+        status: Dict[str, Any] = {"ok": False, "server": False, "model_available": False, "model_loaded": False, "error": None}
+        try:
+            r = self.session.get(f"{self.base_url}/api/tags", timeout=(self.connect_timeout, timeout))
+            r.raise_for_status()
+            status["server"] = True
+            names = {m.get("name") for m in r.json().get("models", [])}
+            status["model_available"] = self.model in names or f"{self.model}:latest" in names
+            # /api/ps lists models currently in memory (newer servers only)
+            r = self.session.get(f"{self.base_url}/api/ps", timeout=(self.connect_timeout, timeout))
+            if r.ok:
+                status["model_loaded"] = any(m.get("name") in (self.model, f"{self.model}:latest") for m in r.json().get("models", []))
+        except Exception as e:
+            status["error"] = str(e)
+        status["ok"] = status["server"] and status["model_available"]
+        return status
+
+    def preload(self) -> bool:
+        """Load the model now (a generate request without a prompt), so the
+        first real call doesn't pay the load time."""
+        payload: Dict[str, Any] = {"model": self.model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        try:
+            self._gate()
+        except LLMUnavailableError:
+            return False
+        t0 = time.perf_counter()
+        try:
+            self._post("/api/generate", payload, self.timeout)
+        except Exception:
+            return False
+        finally:
+            observe("llm_preload_s", time.perf_counter() - t0)
+        return True
+
+    def classify_json(self, prompt: str, system: str | None = None, schema: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """Generate and parse a JSON answer.
+
+        Output is constrained to JSON (to `schema` when given). A fixed
+        `system` prompt lets Ollama reuse the evaluated prefix across calls.
+        Token counts and server-side timings from each response are added
+        to the active run profile.
+        """
         payload = {
             "model": self.model,
             "prompt": prompt,
             "stream": False,
+            "format": schema if schema is not None else "json",
             "options": {"temperature": 0}
         }
-        r = requests.post(url, json=payload, timeout=90)
-        r.raise_for_status()
-        text = r.json().get("response", "").strip()
+        if system is not None:
+            payload["system"] = system
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        self._gate()
+        count("llm_calls")
+        t0 = time.perf_counter()
+        try:
+            r = self._post("/api/generate", payload, self.timeout)
+        except Exception:
+            count("llm_errors")
+            raise
+        finally:
+            observe("llm_latency_s", time.perf_counter() - t0)
+        body = r.json()
+        _account(body)
+        text = body.get("response", "").strip()
 
         # Parse JSON. If model adds text, extract JSON substring.
         try:
@@ -26,10 +182,36 @@ class OllamaClient:
             start = text.find("{")
             end = text.rfind("}")
             if start != -1 and end != -1 and end > start:
-                return json.loads(text[start:end+1])
+                try:
+                    parsed = json.loads(text[start:end+1])
+                except Exception:
+                    pass
+                else:
+                    count("llm_json_extracted")
+                    return parsed
+            count("llm_parse_failures")
             raise ValueError(f"LLM did not return valid JSON. First 300 chars: {text[:300]}")
 
+class ModelCascade:
+    """Ordered LLM clients, cheapest first.
+
+    categorize asks the first tier (with a short prompt) and re-asks the
+    next tier only for answers that fail validation or come back below
+    `escalate_below` confidence. Used where a single client is, it behaves
+    like its first tier.
+    """
+    def __init__(self, tiers: List[Any], escalate_below: float = 0.7):
+        if not tiers:
+            raise ValueError("ModelCascade needs at least one client")
+        self.tiers = tiers
+        self.escalate_below = escalate_below
+        # Cache namespace: results depend on every tier and the threshold
+        self.model = " > ".join(getattr(t, "model", type(t).__name__) for t in tiers) + f" @{escalate_below}"
+
+    def classify_json(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        return self.tiers[0].classify_json(prompt, **kwargs)
+
 class DisabledLLMClient:
     """Fallback when user disables LLM. Always returns minimal output."""
-    def classify_json(self, prompt: str) -> Dict[str, Any]:
+    def classify_json(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
         return {"category": "Other", "confidence": 0.2, "reason": "LLM disabled"}
\ No newline at end of file
@@ -0,0 +1,532 @@
+"""Headless pipeline over many CSV files: categorize, score, summarize, export."""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from src.config import DEFAULT_CATEGORIES, DEFAULT_MERCHANT_RULES, LLM_CACHE_PATH, KNN_PATH, LLM_KEEP_ALIVE, LLM_ESCALATE_BELOW, WATCH_POLL_S, WATCH_SETTLE_S
+from src.ingest import clean_frame, check_columns, iter_ingest_csv
+from src.parsers import detect_date_format
+from src.categorize import categorize_batch, knn_learn_mask
+from src.knn import KNNCategorizer
+from src.anomalies import detect_anomalies, duplicate_keys, render_anomaly_labels, POSSIBLE_DUPLICATE
+from src.baselines import BaselineStore
+from src.compact import export_frame
+from src.utils import fingerprint_from_norm
+from src.trends import monthly_trend, monthly_totals, category_summary
+from src.rollup import Rollup
+from src.profiling import RunProfile, stage, count
+
+STAGES = ["ingest", "categorize", "anomalies", "rollup", "trends", "export", "pdf"]
+
+class PipelineOptions(BaseModel):
+    out_dir: str = "output"
+    categories: List[str] = DEFAULT_CATEGORIES
+    merchant_rules: Dict[str, str] = DEFAULT_MERCHANT_RULES
+    llm_enabled: bool = False
+    ollama_url: str = "http://localhost:11434"
+    ollama_model: str = "llama3.1:8b"
+    # Optional small model tried first; see llm_client.ModelCascade
+    llm_fast_model: str | None = None
+    llm_escalate_below: float = LLM_ESCALATE_BELOW
+    llm_timeout: float = 90
+    llm_keep_alive: str | None = LLM_KEEP_ALIVE
+    llm_preload: bool = True
+    llm_workers: int = 4
+    llm_batch_size: int = 1
+    # Numbered categories, fixed system prompt and schema-constrained output
+    compact_prompts: bool = False
+    llm_reasons: bool = True
+    llm_cache: bool = True
+    canonicalize: bool = True
+    knn: bool = True
+    manual_high_threshold: float | None = None
+    dayfirst: bool = True
+    decimal: str = "."
+    chunk_bytes: int = 64 * 1024 * 1024
+    pdf: bool = False
+    # Full PDF listings: every anomaly plus a transaction appendix
+    pdf_full: bool = False
+    pdf_max_pages: int | None = None
+    pdf_time_budget_s: float | None = None
+    # Append categorized rows to this partitioned Parquet store (src/store.py)
+    results_store: str | None = None
+    # Process each file this many rows at a time in bounded memory (two
+    # passes, see _stream_file); no PDF in this mode
+    stream_rows: int | None = None
+
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """Directories (their *.csv), globs and plain paths, deduplicated in order."""
+    paths: List[str] = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.csv"))))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item)))
+        else:
+            paths.append(item)
+    return list(dict.fromkeys(paths))
+
+def _split_file(path: str, chunk_bytes: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    with open(path, "rb") as f:
+        header = f.readline()
+    size = os.path.getsize(path)
+    start = len(header)
+    ranges = []
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        ranges.append((start, end))
+        start = end
+    return header, ranges or [(len(header), len(header))]
+
+def _read_range(path: str, start: int, end: int, data_start: int) -> bytes:
+    # A chunk owns every line that starts inside [start, end). Assumes no
+    # newlines inside quoted fields, which holds for bank statement exports.
+    with open(path, "rb") as f:
+        if start > data_start:
+            f.seek(start - 1)
+            f.readline()
+        else:
+            f.seek(start)
+        pos = f.tell()
+        if pos >= end:
+            return b""
+        data = f.read(end - pos)
+        if data and not data.endswith(b"\n"):
+            data += f.readline()
+    return data
+
+_WORKER_LLM: Dict[str, Any] = {}
+
+def _stage_seconds(prof: RunProfile) -> Dict[str, float]:
+    return {s: prof.stages.get(s, {}).get("seconds", 0.0) for s in STAGES}
+
+def _llm_client(opts: PipelineOptions, model: str):
+    from src.llm_client import OllamaClient
+    return OllamaClient(
+        base_url=opts.ollama_url,
+        model=model,
+        timeout=opts.llm_timeout,
+        keep_alive=opts.llm_keep_alive,
+        pool_size=opts.llm_workers,
+    )
+
+def load_resources(opts: PipelineOptions) -> Tuple[Any, Any, Any]:
+    """LLM client, LLM cache and kNN model for `opts`, created once per process."""
+    # Pool workers only read the kNN model; the parent process trains and saves it.
+    if "client" not in _WORKER_LLM:
+        _WORKER_LLM["knn"] = KNNCategorizer.load_or_new(KNN_PATH) if opts.knn else None
+        if opts.llm_enabled:
+            from src.llm_client import ModelCascade
+            from src.cache import CategoryCache
+            client = _llm_client(opts, opts.ollama_model)
+            if opts.llm_fast_model:
+                client = ModelCascade([_llm_client(opts, opts.llm_fast_model), client], escalate_below=opts.llm_escalate_below)
+            _WORKER_LLM["client"] = client
+            _WORKER_LLM["cache"] = CategoryCache(LLM_CACHE_PATH) if opts.llm_cache else None
+        else:
+            from src.llm_client import DisabledLLMClient
+            _WORKER_LLM["client"] = DisabledLLMClient()
+            _WORKER_LLM["cache"] = None
+    return _WORKER_LLM["client"], _WORKER_LLM["cache"], _WORKER_LLM["knn"]
+
+def _categorize_frame(df_ok: pd.DataFrame, opts: PipelineOptions) -> pd.DataFrame:
+    llm_client, cache, knn = load_resources(opts)
+    # categorize_batch times itself as the "categorize" stage
+    results = categorize_batch(
+        df_ok["description"].tolist(),
+        llm_client,
+        opts.categories,
+        opts.merchant_rules,
+        max_workers=opts.llm_workers,
+        batch_size=opts.llm_batch_size if opts.llm_enabled else 1,
+        cache=cache,
+        canonicalize=opts.canonicalize,
+        desc_norm=df_ok["desc_norm"].tolist(),
+        knn=knn,
+        knn_learn=False,
+        compact_prompts=opts.compact_prompts,
+        llm_reasons=opts.llm_reasons,
+    )
+    return pd.concat([df_ok, pd.DataFrame(results)], axis=1)
+
+def _run_part(path: str, header: bytes, start: int, end: int, data_start: int, date_format: str | None, opts: PipelineOptions) -> Dict[str, Any]:
+    with RunProfile() as prof:
+        with stage("ingest"):
+            data = _read_range(path, start, end, data_start)
+            df = pd.read_csv(BytesIO(header + data), dtype=str, keep_default_na=False, na_values=[""])
+            df = clean_frame(df, date_format=date_format, dayfirst=opts.dayfirst, decimal=opts.decimal)
+            df_ok = df[df["row_valid"]].reset_index(drop=True)
+        count("rows_ingested", len(df))
+
+        frame = _categorize_frame(df_ok, opts)
+
+    return {
+        "frame": frame,
+        "rows": len(df),
+        "invalid": int((~df["row_valid"]).sum()),
+        "timings": _stage_seconds(prof),
+        "profile": prof.report(),
+    }
+
+def _finalize_file(path: str, frame: pd.DataFrame, opts: PipelineOptions) -> Dict[str, Any]:
+    name = os.path.splitext(os.path.basename(path))[0]
+    out_dir = os.path.join(opts.out_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # detect_anomalies, the trend functions and generate_pdf_report time
+    # themselves into the active profile
+    with RunProfile() as prof:
+        df_out = detect_anomalies(frame, manual_high_threshold=opts.manual_high_threshold, source=os.path.basename(path))
+
+        # One aggregation pass; the summary tables and PDF read from it
+        rollup = Rollup.from_rows(df_out)
+        summary = category_summary(rollup)
+        m_tot = monthly_totals(rollup)
+        m_pivot = monthly_trend(rollup)
+
+        with stage("export"):
+            export = export_frame(df_out)
+            export.to_csv(os.path.join(out_dir, "categorized.csv"), index=False)
+            export[export["is_anomaly"]].to_csv(os.path.join(out_dir, "anomalies.csv"), index=False)
+            summary.to_csv(os.path.join(out_dir, "category_summary.csv"), index=False)
+            m_tot.to_csv(os.path.join(out_dir, "monthly_totals.csv"), index=False)
+            m_pivot.to_csv(os.path.join(out_dir, "monthly_trend.csv"), index=False)
+            if opts.results_store:
+                # Imported here so CSV-only runs don't need pyarrow
+                from src.store import ResultStore
+                ResultStore(opts.results_store).append(df_out, source=os.path.basename(path))
+
+        if opts.pdf:
+            # Imported here so runs without --pdf don't need reportlab
+            from src.report_pdf import generate_pdf_report
+            generate_pdf_report(
+                df_out=df_out,
+                category_summary=summary,
+                monthly_totals=m_tot,
+                title=f"Expense Report: {name}",
+                output=os.path.join(out_dir, "report.pdf"),
+                anomaly_limit=None if opts.pdf_full else 15,
+                include_transactions=opts.pdf_full,
+                max_pages=opts.pdf_max_pages,
+                time_budget_s=opts.pdf_time_budget_s,
+            )
+
+    return {
+        "rollup": rollup.frame,
+        "row": {"file": path, **_file_stats(df_out)},
+        "timings": _stage_seconds(prof),
+        "profile": prof.report(),
+    }
+
+def _file_stats(df_out: pd.DataFrame) -> Dict[str, Any]:
+    methods = df_out["method"].value_counts() if len(df_out) else pd.Series(dtype=int)
+    return {
+        "valid_rows": len(df_out),
+        "total_spend": float(df_out["amount"].sum()) if len(df_out) else 0.0,
+        "anomalies": int(df_out["is_anomaly"].sum()) if len(df_out) else 0,
+        "rule": int(methods.get("rule", 0)),
+        "llm": int(methods.get("llm", 0)),
+        "fallback": int(methods.get("fallback", 0)),
+    }
+
+def _stream_file(path: str, opts: PipelineOptions) -> Dict[str, Any]:
+    """Process one file `opts.stream_rows` rows at a time: categorize and
+    spool chunks while sketching amounts, then score them against the sketches."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    source = os.path.basename(path)
+    out_dir = os.path.join(opts.out_dir, name)
+    spool = os.path.join(out_dir, ".spool")
+    os.makedirs(spool, exist_ok=True)
+    sketches = BaselineStore(":memory:")
+    dup_keys: List[np.ndarray] = []
+    learn: Dict[str, Tuple[str, str]] = {}
+    rows = invalid = chunks = 0
+
+    with RunProfile() as prof:
+        _, _, knn = load_resources(opts)
+        for chunk in iter_ingest_csv(path, chunk_size=opts.stream_rows, dayfirst=opts.dayfirst, decimal=opts.decimal):
+            df_ok = chunk[chunk["row_valid"]].reset_index(drop=True)
+            rows += len(chunk)
+            invalid += len(chunk) - len(df_ok)
+            frame = _categorize_frame(df_ok, opts)
+            sketches.update("all", pd.Series("*", index=frame.index), frame["amount"])
+            sketches.update("category", frame["category"], frame["amount"])
+            dup_keys.append(duplicate_keys(frame))
+            if knn is not None:
+                # One example per merchant is enough for the parent to learn
+                mask = knn_learn_mask(frame)
+                for norm, cat in zip(frame.loc[mask, "desc_norm"], frame.loc[mask, "category"]):
+                    learn[fingerprint_from_norm(norm)] = (norm, cat)
+            frame.to_pickle(os.path.join(spool, f"{chunks}.pkl"))
+            chunks += 1
+
+        keys, counts = np.unique(np.concatenate(dup_keys) if dup_keys else np.zeros(0, dtype=np.uint64), return_counts=True)
+        repeated = keys[counts > 1]
+        del dup_keys, keys, counts
+
+        store = None
+        if opts.results_store:
+            # Imported here so CSV-only runs don't need pyarrow
+            from src.store import ResultStore
+            store = ResultStore(opts.results_store)
+            store.remove_source(source)
+        categorized_csv = os.path.join(out_dir, "categorized.csv")
+        anomalies_csv = os.path.join(out_dir, "anomalies.csv")
+        rollup = Rollup()
+        stats = {"valid_rows": 0, "total_spend": 0.0, "anomalies": 0, "rule": 0, "llm": 0, "fallback": 0}
+        for i in range(chunks):
+            part = os.path.join(spool, f"{i}.pkl")
+            frame = pd.read_pickle(part)
+            os.remove(part)
+            df_out = detect_anomalies(
+                frame,
+                manual_high_threshold=opts.manual_high_threshold,
+                with_labels=False,
+                baselines=sketches,
+                history_includes_batch=True,
+                source=source,
+            )
+            # Duplicates may sit in different chunks
+            dup = np.isin(duplicate_keys(df_out), repeated)
+            df_out["anomaly_flags"] = df_out["anomaly_flags"] | (POSSIBLE_DUPLICATE * dup.astype(np.uint8))
+            # Same column order as detect_anomalies with labels
+            df_out.insert(df_out.columns.get_loc("is_anomaly"), "anomaly_labels", render_anomaly_labels(df_out["anomaly_flags"], opts.manual_high_threshold))
+            df_out["is_anomaly"] = df_out["anomaly_flags"].gt(0)
+            rollup.merge(Rollup.from_rows(df_out))
+            with stage("export"):
+                export = export_frame(df_out)
+                export.to_csv(categorized_csv, mode="w" if i == 0 else "a", header=i == 0, index=False)
+                export[export["is_anomaly"]].to_csv(anomalies_csv, mode="w" if i == 0 else "a", header=i == 0, index=False)
+                if store is not None:
+                    store.append(df_out, source=source, replace=False)
+            for key, value in _file_stats(df_out).items():
+                stats[key] += value
+        os.rmdir(spool)
+
+        with stage("export"):
+            category_summary(rollup).to_csv(os.path.join(out_dir, "category_summary.csv"), index=False)
+            monthly_totals(rollup).to_csv(os.path.join(out_dir, "monthly_totals.csv"), index=False)
+            monthly_trend(rollup).to_csv(os.path.join(out_dir, "monthly_trend.csv"), index=False)
+
+    return {
+        "rollup": rollup.frame,
+        "row": {"file": path, "rows": rows, "invalid_rows": invalid, **stats},
+        "learn": list(learn.values()),
+        "timings": _stage_seconds(prof),
+        "profile": prof.report(),
+    }
+
+def check_llm(opts: PipelineOptions) -> Dict[str, Any]:
+    """Probe the Ollama server before a run and, with `llm_preload`, load
+    the model(s) so the first chunk doesn't wait for them."""
+    client = _llm_client(opts, opts.ollama_model)
+    status = client.health()
+    if status["ok"] and opts.llm_preload:
+        t0 = time.perf_counter()
+        if not status["model_loaded"]:
+            status["model_loaded"] = client.preload()
+        if opts.llm_fast_model:
+            status["fast_model_loaded"] = _llm_client(opts, opts.llm_fast_model).preload()
+        status["preload_s"] = round(time.perf_counter() - t0, 2)
+    return status
+
+def run_pipeline(paths: List[str], opts: PipelineOptions, workers: int | None = None) -> pd.DataFrame:
+    """Process every file; returns one summary row per file with stage seconds
+    (summed across chunks, so they can exceed wall time)."""
+    os.makedirs(opts.out_dir, exist_ok=True)
+    rows: Dict[str, Dict[str, Any]] = {}
+    timings: Dict[str, Dict[str, float]] = {}
+    parts: Dict[str, Dict[int, pd.DataFrame]] = {}
+    expected: Dict[str, int] = {}
+    combined = Rollup()
+    knn = KNNCategorizer.load_or_new(KNN_PATH) if opts.knn else None
+    run_profile = RunProfile()
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for path in paths:
+            timings[path] = dict.fromkeys(STAGES, 0.0)
+            rows[path] = {"file": path, "rows": 0, "invalid_rows": 0}
+            if opts.stream_rows:
+                futures[pool.submit(_stream_file, path, opts)] = ("final", path, -1)
+                continue
+            try:
+                head = pd.read_csv(path, nrows=5000, dtype=str)
+                check_columns(head)
+                date_format = detect_date_format(head["date"], dayfirst=opts.dayfirst)
+                header, ranges = _split_file(path, opts.chunk_bytes)
+            except Exception as e:
+                rows[path]["error"] = str(e)
+                continue
+            expected[path] = len(ranges)
+            parts[path] = {}
+            for i, (start, end) in enumerate(ranges):
+                fut = pool.submit(_run_part, path, header, start, end, len(header), date_format, opts)
+                futures[fut] = ("part", path, i)
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, path, i = futures[fut]
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    rows[path]["error"] = str(e)
+                    expected.pop(path, None)
+                    continue
+                for stage_name, secs in res["timings"].items():
+                    timings[path][stage_name] += secs
+                run_profile.merge(res["profile"])
+                if kind == "final":
+                    rows[path].update(res["row"])
+                    combined.merge(Rollup(res["rollup"]))
+                    if knn is not None and res.get("learn"):
+                        knn.learn([n for n, _ in res["learn"]], [c for _, c in res["learn"]])
+                    continue
+
+                rows[path]["rows"] += res["rows"]
+                rows[path]["invalid_rows"] += res["invalid"]
+                if path not in expected:
+                    continue
+                parts[path][i] = res["frame"]
+                if len(parts[path]) == expected[path]:
+                    # All chunks of this file are in; run the file-level stages
+                    frame = pd.concat([parts[path][k] for k in sorted(parts[path])], ignore_index=True)
+                    del parts[path]
+                    if knn is not None and len(frame):
+                        learn = knn_learn_mask(frame)
+                        knn.learn(frame.loc[learn, "desc_norm"].tolist(), frame.loc[learn, "category"].tolist())
+                    final = pool.submit(_finalize_file, path, frame, opts)
+                    futures[final] = ("final", path, -1)
+                    pending.add(final)
+
+    if knn is not None:
+        knn.save(KNN_PATH)
+    run_profile.wall_s = time.perf_counter() - started
+    with open(os.path.join(opts.out_dir, "run_profile.json"), "w", encoding="utf-8") as f:
+        f.write(run_profile.to_json())
+
+    report = pd.DataFrame([{**rows[p], **{f"{s}_s": round(timings[p][s], 3) for s in STAGES}} for p in paths])
+    report.to_csv(os.path.join(opts.out_dir, "summary.csv"), index=False)
+    if not combined.frame.empty:
+        category_summary(combined).to_csv(os.path.join(opts.out_dir, "combined_category_summary.csv"), index=False)
+        monthly_totals(combined).to_csv(os.path.join(opts.out_dir, "combined_monthly_totals.csv"), index=False)
+        combined.save(os.path.join(opts.out_dir, "rollup.csv"))
+    return report
+
+def _print_watch_report(report: Dict[str, Any]) -> None:
+    if "error" in report:
+        print(f"{report['file']}: {report['error']}")
+    elif report["rows"]:
+        print(f"{report['file']}: {report['new_rows']} new of {report['rows']} rows read, {report['anomalies']} anomalies")
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Categorize expense CSVs and flag anomalies without the Streamlit UI.")
+    parser.add_argument("inputs", nargs="+", help="CSV files, directories or glob patterns")
+    parser.add_argument("--out", default="output", help="Output directory (default: output)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=float, default=64, help="Split files larger than this into parallel chunks")
+    parser.add_argument("--stream-rows", type=int, default=None, help="Process each file this many rows at a time, in memory bounded by the chunk size (no PDF)")
+    parser.add_argument("--llm", action="store_true", help="Send rule misses to Ollama")
+    parser.add_argument("--model", default="llama3.1:8b")
+    parser.add_argument("--url", default="http://localhost:11434")
+    parser.add_argument("--llm-timeout", type=float, default=90)
+    parser.add_argument("--fast-model", default=None, help="Small model asked first; low-confidence answers escalate to --model")
+    parser.add_argument("--escalate-below", type=float, default=LLM_ESCALATE_BELOW, help="Fast-model confidence below which the main model is asked")
+    parser.add_argument("--llm-keep-alive", default=LLM_KEEP_ALIVE, help="How long Ollama keeps the model loaded after a call (e.g. 30m, -1 = forever)")
+    parser.add_argument("--no-preload", action="store_true", help="Don't load the model before the run")
+    parser.add_argument("--llm-workers", type=int, default=4, help="Concurrent LLM requests per process")
+    parser.add_argument("--batch-size", type=int, default=1, help="Descriptions per LLM call")
+    parser.add_argument("--compact-prompts", action="store_true", help="Short prompts with category ids and schema-constrained JSON (no reasons unless --reasons)")
+    parser.add_argument("--reasons", action="store_true", help="With --compact-prompts, still ask for a short reason")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk LLM cache")
+    parser.add_argument("--manual-threshold", type=float, default=None)
+    parser.add_argument("--monthfirst", action="store_true", help="Resolve ambiguous dates month-first")
+    parser.add_argument("--pdf", action="store_true", help="Also write a PDF report per file (needs reportlab)")
+    parser.add_argument("--parquet", action="store_true", help="Append categorized rows to a month/category partitioned Parquet store (<out>/results)")
+    parser.add_argument("--parquet-dir", default=None, help="Parquet store location (implies --parquet)")
+    parser.add_argument("--pdf-full", action="store_true", help="List every anomaly and append all transactions to the PDF")
+    parser.add_argument("--pdf-max-pages", type=int, default=None, help="Stop PDF listings after this many pages")
+    parser.add_argument("--pdf-time-budget", type=float, default=None, help="Stop PDF listings after this many seconds")
+    parser.add_argument("--watch", action="store_true", help="Keep running: process new rows of new or growing CSVs in the inputs as they appear (see src/watch.py)")
+    parser.add_argument("--poll", type=float, default=WATCH_POLL_S, help="With --watch, seconds between scans")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_S, help="With --watch, seconds a file must be unmodified before it is read")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths and not args.watch:
+        parser.error("no CSV files matched")
+    if args.stream_rows and (args.pdf or args.pdf_full):
+        parser.error("--pdf needs whole files in memory and can't be combined with --stream-rows")
+
+    opts = PipelineOptions(
+        out_dir=args.out,
+        llm_enabled=args.llm,
+        ollama_url=args.url,
+        ollama_model=args.model,
+        llm_fast_model=args.fast_model,
+        llm_escalate_below=args.escalate_below,
+        llm_timeout=args.llm_timeout,
+        llm_keep_alive=args.llm_keep_alive,
+        llm_preload=not args.no_preload,
+        llm_workers=args.llm_workers,
+        llm_batch_size=args.batch_size,
+        compact_prompts=args.compact_prompts,
+        llm_reasons=args.reasons or not args.compact_prompts,
+        llm_cache=not args.no_cache,
+        manual_high_threshold=args.manual_threshold,
+        dayfirst=not args.monthfirst,
+        chunk_bytes=max(1, int(args.chunk_mb * 1024 * 1024)),
+        pdf=args.pdf or args.pdf_full,
+        pdf_full=args.pdf_full,
+        pdf_max_pages=args.pdf_max_pages,
+        pdf_time_budget_s=args.pdf_time_budget,
+        results_store=args.parquet_dir or (os.path.join(args.out, "results") if args.parquet else None),
+        stream_rows=args.stream_rows,
+    )
+
+    if opts.llm_enabled:
+        status = check_llm(opts)
+        if not status["server"]:
+            print(f"Ollama at {opts.ollama_url} is unreachable ({status['error']}); rule misses will fall back to Other.")
+        elif not status["model_available"]:
+            print(f"Model {opts.ollama_model} is not pulled on {opts.ollama_url}; rule misses will fall back to Other.")
+        elif "preload_s" in status:
+            print(f"Loaded models in {status['preload_s']}s")
+
+    if args.watch:
+        # Imported here: src.watch builds on this module
+        from src.watch import Watcher
+        watcher = Watcher(args.inputs, opts, settle_s=args.settle)
+        print(f"Watching {', '.join(args.inputs)} every {args.poll:g}s; results in {os.path.abspath(watcher.store.root)}")
+        try:
+            watcher.run(poll_s=args.poll, on_report=_print_watch_report)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    started = time.perf_counter()
+    report = run_pipeline(paths, opts, workers=args.workers)
+    wall = time.perf_counter() - started
+
+    cols = ["file", "rows", "invalid_rows", "valid_rows", "anomalies"] + [f"{s}_s" for s in STAGES]
+    if "error" in report.columns:
+        cols.append("error")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report[[c for c in cols if c in report.columns]].to_string(index=False))
+    print("\nStage totals (s): " + ", ".join(f"{s}={report[f'{s}_s'].sum():.2f}" for s in STAGES))
+    print(f"Wall time: {wall:.2f}s. Outputs in {os.path.abspath(opts.out_dir)}")
+    print(f"Run profile: {os.path.join(os.path.abspath(opts.out_dir), 'run_profile.json')}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Lightweight run instrumentation: stage timings, counters, latency histograms.
+
+Instrumented functions report into the active RunProfile, if any, so the
+cost when nothing is being profiled is a single context variable lookup.
+The active profile is per thread / asyncio context, so concurrent app
+sessions don't record into each other's; pool threads inherit it when
+started through submit(). Worker processes return their own report() for
+the parent to merge().
+
+    with RunProfile() as prof:
+        df = ingest_csv(path)
+        ...
+    print(prof.to_json())
+"""
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Upper bounds (seconds) of latency histogram buckets; the last is open-ended
+LATENCY_BUCKETS: List[float] = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, float("inf")]
+
+_ACTIVE: "contextvars.ContextVar[RunProfile | None]" = contextvars.ContextVar("run_profile", default=None)
+
+class RunProfile:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+        self.wall_s = 0.0
+        self.peak_traced_mb: float | None = None
+        # Highest peak RSS reported by merged profiles (worker processes)
+        self.peak_rss_merged_mb = 0.0
+        self._t0 = 0.0
+        self._lock = threading.Lock()
+        self._previous: "RunProfile | None" = None
+        self._running = False
+        self._tracing = False
+
+    def start(self) -> "RunProfile":
+        """Make this the active profile in the current context; prefer
+        `with RunProfile():` so it is stopped on errors too. Can be started
+        again after stop(); times accumulate."""
+        if self._running:
+            return self
+        self._previous = _ACTIVE.get()
+        _ACTIVE.set(self)
+        self._running = True
+        self._t0 = time.perf_counter()
+        # Only the profile that started tracing stops it
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        return self
+
+    def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self.wall_s += time.perf_counter() - self._t0
+        if self._tracing:
+            peak = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            self.peak_traced_mb = max(self.peak_traced_mb or 0.0, peak)
+            tracemalloc.stop()
+            self._tracing = False
+        if _ACTIVE.get() is self:
+            # Skip enclosing profiles that were stopped out of order
+            prev = self._previous
+            while prev is not None and not prev._running:
+                prev = prev._previous
+            _ACTIVE.set(prev)
+
+    def __enter__(self) -> "RunProfile":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def add_time(self, stage_name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            s = self.stages.setdefault(stage_name, {"seconds": 0.0, "calls": 0})
+            s["seconds"] += seconds
+            s["calls"] += calls
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = {"count": 0, "sum": 0.0, "min": value, "max": value, "buckets": [0] * len(LATENCY_BUCKETS)}
+            h["count"] += 1
+            h["sum"] += value
+            h["min"] = min(h["min"], value)
+            h["max"] = max(h["max"], value)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    h["buckets"][i] += 1
+                    break
+
+    def merge(self, report: Dict[str, Any]) -> None:
+        """Fold in another profile's report(), e.g. from a worker process."""
+        for name, s in report.get("stages", {}).items():
+            self.add_time(name, s["seconds"], s["calls"])
+        for name, n in report.get("counters", {}).items():
+            self.count(name, n)
+        with self._lock:
+            for name, h in report.get("histograms", {}).items():
+                mine = self.histograms.get(name)
+                if mine is None:
+                    self.histograms[name] = {**h, "buckets": list(h["buckets"])}
+                    continue
+                mine["count"] += h["count"]
+                mine["sum"] += h["sum"]
+                mine["min"] = min(mine["min"], h["min"])
+                mine["max"] = max(mine["max"], h["max"])
+                mine["buckets"] = [a + b for a, b in zip(mine["buckets"], h["buckets"])]
+            self.peak_rss_merged_mb = max(self.peak_rss_merged_mb, report.get("peak_rss_mb", 0.0))
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            histograms = {
+                name: {
+                    **h,
+                    "mean": h["sum"] / h["count"] if h["count"] else 0.0,
+                    "bucket_bounds": [str(b) for b in LATENCY_BUCKETS],
+                }
+                for name, h in self.histograms.items()
+            }
+            out = {
+                "started_at": self.started_at,
+                "wall_s": round(self.wall_s, 4),
+                "stages": {k: {"seconds": round(v["seconds"], 4), "calls": v["calls"]} for k, v in self.stages.items()},
+                "counters": dict(self.counters),
+                "histograms": histograms,
+            }
+        if resource is not None:
+            # ru_maxrss is KiB on Linux
+            out["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+        if self.peak_rss_merged_mb:
+            out["peak_rss_mb"] = max(out.get("peak_rss_mb", 0.0), self.peak_rss_merged_mb)
+        if self.peak_traced_mb is not None:
+            out["peak_traced_mb"] = self.peak_traced_mb
+        return out
+
+    def to_json(self) -> str:
+        return json.dumps(self.report(), indent=2)
+
+def active() -> "RunProfile | None":
+    return _ACTIVE.get()
+
+def submit(pool: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """pool.submit() running `fn` in a copy of the caller's context, so the
+    pool thread reports into the caller's active profile."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+@contextmanager
+def stage(name: str):
+    prof = _ACTIVE.get()
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.add_time(name, time.perf_counter() - t0)
+
+def profiled(name: str) -> Callable:
+    """Decorator timing every call of a function as stage `name`."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name: str, n: int = 1) -> None:
+    prof = _ACTIVE.get()
+    if prof is not None and n:
+        prof.count(name, n)
+
+def observe(name: str, value: float) -> None:
+    prof = _ACTIVE.get()
+    if prof is not None:
+        prof.observe(name, value)
@@ -0,0 +1,122 @@
+from typing import Any, Dict, List, Set, Tuple
+
+import pandas as pd
+
+from src.categorize import categorize_batch, rule_based_categories
+from src.compact import expand_columns
+from src.profiling import profiled, count
+from src.rules import get_rule_index
+
+RESULT_COLUMNS = ["category", "confidence", "reason", "method"]
+
+def changed_keywords(
+    old_rules: Dict[str, str],
+    new_rules: Dict[str, str],
+    old_categories: List[str],
+    new_categories: List[str],
+) -> Set[str]:
+    """Keywords whose hits can categorize differently under the new settings:
+    added, removed, remapped or reordered rules, plus rules pointing at a
+    category that was added or removed (those flip between a rule hit and
+    the forced-Other fallback)."""
+    flipped = set(old_categories) ^ set(new_categories)
+    keys = set(old_rules) | set(new_rules)
+    return {
+        k for k in keys
+        if k and (old_rules.get(k) != new_rules.get(k) or new_rules.get(k) in flipped)
+    } | _reordered(old_rules, new_rules)
+
+def _reordered(old_rules: Dict[str, str], new_rules: Dict[str, str]) -> Set[str]:
+    # Rule order breaks ties between hits in one description, so a keyword
+    # that swapped places with any other shared keyword can change outcome
+    old_rank = {k: i for i, k in enumerate(old_rules)}
+    ranks = [old_rank[k] for k in new_rules if k in old_rank]
+    shared = [k for k in new_rules if k in old_rank]
+    out: Set[str] = set()
+    running_max = -1
+    for k, r in zip(shared, ranks):
+        if running_max > r:
+            out.add(k)
+        running_max = max(running_max, r)
+    running_min = len(old_rank)
+    for k, r in zip(reversed(shared), reversed(ranks)):
+        if running_min < r:
+            out.add(k)
+        running_min = min(running_min, r)
+    return out
+
+@profiled("categorize")
+def recategorize(
+    previous: pd.DataFrame,
+    old_rules: Dict[str, str],
+    new_rules: Dict[str, str],
+    old_categories: List[str],
+    new_categories: List[str],
+    llm_client,
+    **batch_kwargs: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Update categorized rows after a rules or categories edit, touching
+    only rows whose outcome can change.
+
+    `previous` holds description/desc_norm plus the category, confidence,
+    reason and method columns from an earlier run with `old_rules` and
+    `old_categories`. Rows are recomputed when their description contains a
+    keyword from changed_keywords() (rule hits are resolved directly; rows
+    that lose their rule go through categorize_batch) or when an LLM / kNN
+    answer names a removed category. Everything else, including LLM answers
+    that might now prefer a newly added category, is kept; run a full
+    categorization to revisit those. `batch_kwargs` are passed to
+    categorize_batch (cache, knn, batch_size, ...).
+
+    Returns (updated frame, diff of rows whose category or method changed).
+    """
+    out = expand_columns(previous.copy(), RESULT_COLUMNS)
+    norms = out["desc_norm"].fillna("")
+
+    changed = changed_keywords(old_rules, new_rules, old_categories, new_categories)
+    if changed:
+        touched = get_rule_index({k: k for k in changed}).match_series(norms)["rule_key"].notna()
+    else:
+        touched = pd.Series(False, index=out.index)
+    count("recat_rows_touched", int(touched.sum()))
+
+    old_hit = pd.Series(False, index=out.index)
+    new_hit = pd.Series(False, index=out.index)
+    if touched.any():
+        rows = out.index[touched]
+        old_hit.loc[rows] = rule_based_categories(out.loc[rows, "description"], old_rules, old_categories, norms.loc[rows])["category"].notna()
+        new_rb = rule_based_categories(out.loc[rows, "description"], new_rules, new_categories, norms.loc[rows])
+        hits = new_rb["category"].notna()
+        new_hit.loc[rows] = hits
+        out.loc[rows[hits.to_numpy()], RESULT_COLUMNS] = new_rb.loc[hits, RESULT_COLUMNS].to_numpy()
+
+    removed = set(old_categories) - set(new_categories)
+    stale = ~new_hit & (
+        (touched & old_hit)
+        | (out["method"].isin(["llm", "knn"]) & out["category"].isin(removed))
+    )
+    count("recat_rows_redone", int(stale.sum()))
+    if stale.any():
+        rows = out.index[stale]
+        results = categorize_batch(
+            out.loc[rows, "description"].tolist(),
+            llm_client,
+            new_categories,
+            new_rules,
+            desc_norm=norms.loc[rows].tolist(),
+            **batch_kwargs,
+        )
+        out.loc[rows, RESULT_COLUMNS] = pd.DataFrame(results, columns=RESULT_COLUMNS).to_numpy()
+    out["confidence"] = out["confidence"].astype(float)
+
+    moved = (out["category"] != previous["category"]) | (out["method"] != previous["method"])
+    diff = pd.DataFrame({
+        "description": out.loc[moved, "description"],
+        "old_category": previous.loc[moved, "category"],
+        "new_category": out.loc[moved, "category"],
+        "old_method": previous.loc[moved, "method"],
+        "new_method": out.loc[moved, "method"],
+        "reason": out.loc[moved, "reason"],
+    })
+    count("recat_rows_changed", len(diff))
+    return out, diff
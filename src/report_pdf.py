@@ -1,101 +1,256 @@
+import time
 from io import BytesIO
-from typing import Optional
+from typing import Callable, Iterator, List, NamedTuple
 import pandas as pd
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
+from src.anomalies import render_anomaly_labels
+from src.profiling import profiled, count
+from src.utils import map_unique
 
+# Listing rows are set in a monospace font, one text line per row, so a
+# table page is a single text object instead of a drawString per cell.
+LISTING_FONT = "Courier"
+LISTING_SIZE = 7.5
+LISTING_LEADING = 9.5
+LISTING_BLOCK_ROWS = 20_000
+# Listing lines left free on the last allowed page: truncation notes for
+# the anomaly listing and the skipped appendix
+NOTE_RESERVE_LINES = 3
+
+class Column(NamedTuple):
+    header: str
+    width: int
+    # Formats a column slice into strings; padding/truncation is done by the table
+    fmt: Callable[[pd.Series], pd.Series]
+    align_right: bool = False
+
+def _dates(s: pd.Series) -> pd.Series:
+    # Few distinct dates per statement: format each once
+    return map_unique(s, lambda d: "" if d is None or pd.isna(d) else pd.Timestamp(d).strftime("%Y-%m-%d"))
+
+def _money(s: pd.Series) -> pd.Series:
+    return s.map("{:,.2f}".format)
+
+def _text(s: pd.Series) -> pd.Series:
+    return s.astype(str)
+
+def _percent(s: pd.Series) -> pd.Series:
+    return s.map("{:.2f}%".format)
+
+TRANSACTION_COLUMNS: List[Column] = [
+    Column("Date", 10, _dates),
+    Column("Amount", 13, _money, align_right=True),
+    Column("Category", 16, _text),
+    Column("Method", 8, _text),
+    Column("Description", 50, _text),
+]
+
+ANOMALY_COLUMNS: List[Column] = [
+    Column("Date", 10, _dates),
+    Column("Amount", 13, _money, align_right=True),
+    Column("Category", 16, _text),
+    Column("Description", 34, _text),
+    Column("Reason", 24, _text),
+]
+
+class Pager:
+    """Top-down page layout on a canvas with a repeated page header/footer.
+
+    Sections call ensure() before drawing; when a page fills up the current
+    page is closed (footer with page number) and a new one is started with
+    the report title and the running section name. `max_pages` and
+    `time_budget_s` bound the listings: once either is spent, exhausted()
+    turns true and tables stop at the next page break. The last page a
+    listing may use keeps room for the truncation notes.
+    """
+    def __init__(self, c: canvas.Canvas, title: str, max_pages: int | None = None, time_budget_s: float | None = None):
+        self.c = c
+        self.title = title
+        self.width, self.height = A4
+        self.left, self.top, self.bottom = 50, A4[1] - 50, 60
+        self.y = self.top
+        self.page = 1
+        self.section = ""
+        self.max_pages = max_pages
+        self.deadline = time.perf_counter() + time_budget_s if time_budget_s else None
+
+    def exhausted(self) -> bool:
+        if self.max_pages is not None and self.page >= self.max_pages:
+            return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def _footer(self) -> None:
+        self.c.setFont("Helvetica", 8)
+        self.c.drawRightString(self.width - self.left, 30, f"Page {self.page}")
+
+    def new_page(self) -> None:
+        self._footer()
+        self.c.showPage()
+        self.page += 1
+        self.y = self.top
+        self.c.setFont("Helvetica", 8)
+        self.c.drawString(self.left, self.y, self.title)
+        self.y -= 20
+        if self.section:
+            self.c.setFont("Helvetica-Bold", 12)
+            self.c.drawString(self.left, self.y, f"{self.section} (cont.)")
+            self.y -= 20
+
+    def ensure(self, height: float) -> None:
+        if self.y - height < self.bottom:
+            self.new_page()
+
+    def heading(self, text: str, size: int = 12) -> None:
+        self.section = text
+        self.ensure(40)
+        self.y -= 10
+        self.c.setFont("Helvetica-Bold", size)
+        self.c.drawString(self.left, self.y, text)
+        self.y -= 18
+
+    def text(self, text: str, font: str = "Helvetica", size: float = 10, leading: float = 15) -> None:
+        self.ensure(leading)
+        self.c.setFont(font, size)
+        self.c.drawString(self.left, self.y, text)
+        self.y -= leading
+
+    def row(self, cells: List[str], xs: List[float], size: float = 9, leading: float = 12) -> None:
+        self.ensure(leading)
+        self.c.setFont("Helvetica", size)
+        for x, cell in zip(xs, cells):
+            self.c.drawString(self.left + x, self.y, cell)
+        self.y -= leading
+
+    def close(self) -> None:
+        self._footer()
+        self.c.showPage()
+
+def _format_block(frame: pd.DataFrame, columns: List[Column], names: List[str]) -> List[str]:
+    line = None
+    for col, name in zip(columns, names):
+        cells = col.fmt(frame[name]).astype(str).str.slice(0, col.width)
+        cells = cells.str.rjust(col.width) if col.align_right else cells.str.ljust(col.width)
+        line = cells if line is None else line + " " + cells
+    return line.tolist() if line is not None else []
+
+def _listing_lines(frame: pd.DataFrame, columns: List[Column], names: List[str]) -> Iterator[str]:
+    for start in range(0, len(frame), LISTING_BLOCK_ROWS):
+        yield from _format_block(frame.iloc[start:start + LISTING_BLOCK_ROWS], columns, names)
+
+def draw_listing(pager: Pager, title: str, frame: pd.DataFrame, columns: List[Column], names: List[str], total: int | None = None) -> int:
+    """Draw every row of `frame` as a paginated table; returns rows drawn.
+
+    Rows are formatted a block at a time from column arrays, so memory
+    holds one block of strings regardless of the frame's size. Column
+    headers repeat on every page. `total` is the row count `frame` was
+    cut from, shown in the heading.
+    """
+    shown = f"{len(frame):,} of {total:,}" if total is not None and total != len(frame) else f"{len(frame):,}"
+    pager.heading(f"{title} ({shown} rows)")
+    header = " ".join(c.header.rjust(c.width) if c.align_right else c.header.ljust(c.width) for c in columns)
+    lines = _listing_lines(frame, columns, names)
+    pending = next(lines, None)
+    drawn = 0
+    while pending is not None:
+        pager.ensure(LISTING_LEADING * 3)
+        fit = int((pager.y - pager.bottom) // LISTING_LEADING) - 1
+        if pager.max_pages is not None and pager.page >= pager.max_pages:
+            fit = max(1, fit - NOTE_RESERVE_LINES)
+        text = pager.c.beginText(pager.left, pager.y)
+        text.setFont(LISTING_FONT, LISTING_SIZE, LISTING_LEADING)
+        text.textLine(header)
+        taken = 0
+        while pending is not None and taken < fit:
+            text.textLine(pending)
+            taken += 1
+            pending = next(lines, None)
+        pager.c.drawText(text)
+        drawn += taken
+        pager.y -= LISTING_LEADING * (taken + 1)
+        if pending is not None:
+            if pager.exhausted():
+                break
+            pager.new_page()
+    return drawn
+
+def _truncation_note(pager: Pager, drawn: int, total: int) -> None:
+    if drawn < total:
+        count("pdf_rows_truncated", total - drawn)
+        pager.text(
+            f"Listing truncated after {drawn:,} of {total:,} rows (page/time budget); see the categorized CSV for all rows.",
+            font="Helvetica-Oblique", size=8, leading=12,
+        )
+
+@profiled("pdf")
 def generate_pdf_report(
     df_out: pd.DataFrame,
     category_summary: pd.DataFrame,
     monthly_totals: pd.DataFrame,
     title: str = "AI Expense Categorizer Report",
-) -> bytes:
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
+    output: str | None = None,
+    anomaly_limit: int | None = 15,
+    include_transactions: bool = False,
+    max_pages: int | None = None,
+    time_budget_s: float | None = None,
+) -> bytes | str:
+    """Render the report. Returns the PDF bytes, or `output` when a file
+    path is given (the PDF is written there directly, without an in-memory
+    copy of the finished file).
 
-    y = height - 50
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, y, title)
+    `anomaly_limit=None` lists every anomaly and `include_transactions`
+    adds a full transaction appendix; `max_pages` / `time_budget_s` cap
+    those listings, ending them with a truncation note.
+    """
+    target = output if output is not None else BytesIO()
+    c = canvas.Canvas(target, pagesize=A4, pageCompression=1)
+    c.setTitle(title)
+    pager = Pager(c, title, max_pages=max_pages, time_budget_s=time_budget_s)
 
-    y -= 25
-    c.setFont("Helvetica", 10)
-    c.drawString(50, y, f"Total rows processed: {len(df_out)}")
-    y -= 15
-    anomalies_count = int(df_out["is_anomaly"].sum()) if "is_anomaly" in df_out.columns else 0
-    c.drawString(50, y, f"Anomalies flagged: {anomalies_count}")
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(pager.left, pager.y, title)
+    pager.y -= 25
+    pager.text(f"Total rows processed: {len(df_out)}")
+    is_anomaly = df_out["is_anomaly"] if "is_anomaly" in df_out.columns else pd.Series(False, index=df_out.index)
+    pager.text(f"Anomalies flagged: {int(is_anomaly.sum())}")
 
     # Category Summary
-    y -= 30
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Spending by Category")
-
-    y -= 18
-    c.setFont("Helvetica", 9)
-    c.drawString(50, y, "Category")
-    c.drawString(260, y, "Total")
-    c.drawString(360, y, "Percent")
-
-    y -= 12
-    for _, row in category_summary.head(12).iterrows():
-        if y < 80:
-            c.showPage()
-            y = height - 50
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y, "Spending by Category (cont.)")
-            y -= 20
-            c.setFont("Helvetica", 9)
-        c.drawString(50, y, str(row["category"])[:30])
-        c.drawString(260, y, f"{row['amount']:.2f}")
-        c.drawString(360, y, f"{row['percent']:.2f}%")
-        y -= 12
+    pager.heading("Spending by Category")
+    xs = [0, 210, 310]
+    pager.row(["Category", "Total", "Percent"], xs)
+    top = category_summary.head(12)
+    for cat, amount, pct in zip(top["category"].astype(str).str.slice(0, 30), _money(top["amount"]), _percent(top["percent"])):
+        pager.row([cat, amount, pct], xs)
 
     # Monthly totals
-    y -= 20
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Monthly Totals")
-
-    y -= 18
-    c.setFont("Helvetica", 9)
-    c.drawString(50, y, "Month")
-    c.drawString(260, y, "Total")
-
-    y -= 12
-    for _, row in monthly_totals.iterrows():
-        if y < 80:
-            c.showPage()
-            y = height - 50
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y, "Monthly Totals (cont.)")
-            y -= 20
-            c.setFont("Helvetica", 9)
-        c.drawString(50, y, str(row["month"]))
-        c.drawString(260, y, f"{row['amount']:.2f}")
-        y -= 12
-
-    # Anomalies section (top 15)
-    y -= 20
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Anomalies (Top 15)")
-
-    y -= 18
-    c.setFont("Helvetica", 8)
-    anom = df_out[df_out.get("is_anomaly", False)].copy()
-    anom = anom.head(15)
-
-    for _, row in anom.iterrows():
-        if y < 80:
-            c.showPage()
-            y = height - 50
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y, "Anomalies (cont.)")
-            y -= 20
-            c.setFont("Helvetica", 8)
-
-        line = f"{row['date'].date()} | {row['amount']:.2f} | {str(row['category'])} | {str(row['description'])[:50]} | {str(row['anomaly_labels'])[:45]}"
-        c.drawString(50, y, line)
-        y -= 11
-
-    c.showPage()
+    pager.heading("Monthly Totals")
+    xs = [0, 210]
+    pager.row(["Month", "Total"], xs)
+    for month, amount in zip(monthly_totals["month"].astype(str), _money(monthly_totals["amount"])):
+        pager.row([month, amount], xs)
+
+    # Anomalies
+    anom = df_out[is_anomaly]
+    if "anomaly_labels" not in anom.columns:
+        # Never the categorization reason: it doesn't explain the flag
+        labels = render_anomaly_labels(anom["anomaly_flags"]) if "anomaly_flags" in anom.columns else ""
+        anom = anom.assign(anomaly_labels=labels)
+    names = ["date", "amount", "category", "description", "anomaly_labels"]
+    if anomaly_limit is None:
+        drawn = draw_listing(pager, "Anomalies", anom, ANOMALY_COLUMNS, names)
+        _truncation_note(pager, drawn, len(anom))
+    else:
+        draw_listing(pager, "Anomalies", anom.head(anomaly_limit), ANOMALY_COLUMNS, names, total=len(anom))
+
+    if include_transactions:
+        # The appendix starts on a new page, which the budget may not allow
+        drawn = 0
+        if not pager.exhausted():
+            pager.new_page()
+            drawn = draw_listing(pager, "Appendix: All Transactions", df_out, TRANSACTION_COLUMNS, ["date", "amount", "category", "method", "description"])
+        _truncation_note(pager, drawn, len(df_out))
+
+    pager.close()
     c.save()
-    return buffer.getvalue()
\ No newline at end of file
+    count("pdf_pages", pager.page)
+    return output if output is not None else target.getvalue()
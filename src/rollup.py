@@ -0,0 +1,121 @@
+import os
+from typing import Iterable, List
+
+import pandas as pd
+
+from src.profiling import profiled
+from src.compact import expand_results, result_amounts
+from src.utils import map_unique, month_labels, fingerprint_from_norm
+
+MEASURES = ["amount_sum", "count", "amount_min", "amount_max", "anomalies"]
+# How each measure combines when rollups are merged
+_MERGE_AGG = {"amount_sum": "sum", "count": "sum", "amount_min": "min", "amount_max": "max", "anomalies": "sum"}
+
+class Rollup:
+    """Month x category (x merchant) aggregate of categorized rows.
+
+    Holds sum, count, min, max and anomaly count per cell, computed in one
+    groupby over the rows. Rollups of separate batches merge into the
+    rollup of their union, and the category summary, monthly totals and
+    month x category pivot are read from the cells without going back to
+    the rows. With `merchants`, cells are also split by merchant
+    fingerprint (see utils.fingerprint_from_norm).
+    """
+    def __init__(self, frame: pd.DataFrame | None = None, merchants: bool = False):
+        self.merchants = merchants
+        self.keys: List[str] = ["month", "category", "merchant"] if merchants else ["month", "category"]
+        if frame is None:
+            frame = pd.DataFrame({**{k: pd.Series(dtype=object) for k in self.keys}, **{m: pd.Series(dtype=float) for m in MEASURES}})
+        self.frame = frame
+
+    @classmethod
+    def load(cls, path: str) -> "Rollup":
+        """Rollup written by save(), or an empty one if `path` doesn't exist."""
+        if not os.path.exists(path):
+            return cls()
+        frame = pd.read_csv(path, dtype={"month": str, "category": str, "merchant": str}, keep_default_na=False)
+        return cls(frame, merchants="merchant" in frame.columns)
+
+    def save(self, path: str) -> None:
+        # Write then rename, so readers never see a half-written file
+        tmp = f"{path}.tmp"
+        self.frame.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    @profiled("rollup")
+    def from_rows(cls, df: pd.DataFrame, merchants: bool = False) -> "Rollup":
+        keys = pd.DataFrame({
+            "month": month_labels(df["date"]),
+            "category": df["category"].astype(object).fillna("Other").astype(str),
+        }, index=df.index)
+        if merchants:
+            # Compact frames keep no desc_norm or description column
+            if "desc_norm" not in df.columns:
+                df = expand_results(df)
+            norms = df["desc_norm"] if "desc_norm" in df.columns else df["description"]
+            keys["merchant"] = map_unique(norms, lambda n: fingerprint_from_norm(n or ""))
+        is_anomaly = df["is_anomaly"] if "is_anomaly" in df.columns else pd.Series(False, index=df.index)
+        temp = keys.assign(amount=result_amounts(df), is_anomaly=is_anomaly.astype(bool))
+        frame = (
+            temp.groupby(list(keys.columns), sort=True, observed=True)
+            .agg(
+                amount_sum=("amount", "sum"),
+                count=("amount", "size"),
+                amount_min=("amount", "min"),
+                amount_max=("amount", "max"),
+                anomalies=("is_anomaly", "sum"),
+            )
+            .reset_index()
+        )
+        return cls(frame, merchants=merchants)
+
+    def merge(self, other: "Rollup") -> "Rollup":
+        """Fold `other` into this rollup (in place) and return it."""
+        if other.merchants != self.merchants:
+            raise ValueError("Cannot merge rollups with and without merchant cells")
+        if other.frame.empty:
+            return self
+        if self.frame.empty:
+            self.frame = other.frame.copy()
+            return self
+        both = pd.concat([self.frame, other.frame], ignore_index=True)
+        self.frame = both.groupby(self.keys, sort=True).agg(_MERGE_AGG).reset_index()
+        return self
+
+    def _months(self, months: Iterable[str] | None) -> pd.DataFrame:
+        if months is None:
+            return self.frame
+        return self.frame[self.frame["month"].isin(list(months))]
+
+    def category_summary(self) -> pd.DataFrame:
+        summary = (
+            self.frame.groupby("category")["amount_sum"].sum()
+            .rename("amount")
+            .reset_index()
+            .sort_values("amount", ascending=False)
+        )
+        total_spend = summary["amount"].sum() if len(summary) else 0.0
+        summary["percent"] = (summary["amount"] / total_spend * 100).round(2) if total_spend else 0.0
+        return summary
+
+    def monthly_totals(self, months: Iterable[str] | None = None) -> pd.DataFrame:
+        cells = self._months(months)
+        return cells.groupby("month")["amount_sum"].sum().rename("amount").reset_index().sort_values("month")
+
+    def monthly_trend(self, months: Iterable[str] | None = None) -> pd.DataFrame:
+        cells = self._months(months)
+        pivot = cells.pivot_table(
+            index="month",
+            columns="category",
+            values="amount_sum",
+            aggfunc="sum",
+            fill_value=0.0
+        ).reset_index()
+        return pivot.sort_values("month")
+
+    def anomaly_count(self) -> int:
+        return int(self.frame["anomalies"].sum())
+
+    def total_rows(self) -> int:
+        return int(self.frame["count"].sum())
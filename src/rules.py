@@ -0,0 +1,108 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+RULE_CONFIDENCE = 0.95
+RULE_REASON_PREFIX = "Matched rule: "
+_INDEX_CACHE_SIZE = 16
+_INDEX_CACHE: "OrderedDict[str, RuleIndex]" = OrderedDict()
+
+def rules_hash(merchant_rules: Dict[str, str], priorities: Dict[str, int] | None = None) -> str:
+    # Rule order takes part in precedence, so it is part of the key
+    payload = json.dumps(
+        [list(merchant_rules.items()), sorted((priorities or {}).items())],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _trie_pattern(keys: List[str]) -> str:
+    # Children come before the optional end, so the longest keyword wins
+    trie: dict = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            body = ("(?:" + body + ")?") if len(branches) == 1 else body + "?"
+        return body
+
+    return emit(trie)
+
+class RuleIndex:
+    """Merchant rules compiled into one regex. Overlapping hits keep the
+    longest keyword; then priority, rule order and position decide."""
+    def __init__(self, merchant_rules: Dict[str, str], priorities: Dict[str, int] | None = None):
+        self.rules = {k: v for k, v in merchant_rules.items() if k}
+        self.priorities = priorities or {}
+        self._order = {k: i for i, k in enumerate(self.rules)}
+        self.key = rules_hash(merchant_rules, priorities)
+        if self.rules:
+            # Lookahead finds overlapping hits in one scan
+            self._pattern = re.compile("(?=(" + _trie_pattern(list(self.rules)) + "))")
+        else:
+            self._pattern = None
+
+    def matches(self, desc_norm: str) -> List[Tuple[str, int]]:
+        if self._pattern is None or not desc_norm:
+            return []
+        return [(m.group(1), m.start()) for m in self._pattern.finditer(desc_norm)]
+
+    def best_match(self, desc_norm: str) -> str | None:
+        hits = self.matches(desc_norm)
+        if not hits:
+            return None
+        if len(hits) > 1:
+            # Drop hits covered by a longer overlapping hit
+            hits = [
+                (k, s) for k, s in hits
+                if not any(len(k2) > len(k) and s2 < s + len(k) and s < s2 + len(k2) for k2, s2 in hits)
+            ]
+        key, _ = min(hits, key=lambda h: (-self.priorities.get(h[0], 0), self._order[h[0]], h[1]))
+        return key
+
+    def match(self, desc_norm: str) -> Tuple[str, float, str] | None:
+        key = self.best_match(desc_norm)
+        if key is None:
+            return None
+        return self.rules[key], RULE_CONFIDENCE, f"{RULE_REASON_PREFIX}{key}"
+
+    def match_series(self, desc_norm: pd.Series) -> pd.DataFrame:
+        """Match a whole column at once; each unique description is scanned once."""
+        uniques = pd.unique(desc_norm.fillna("").to_numpy())
+        keys = pd.Series([self.best_match(d) for d in uniques], index=uniques, dtype=object)
+        matched = desc_norm.fillna("").map(keys)
+        has_hit = matched.notna()
+        out = pd.DataFrame(index=desc_norm.index)
+        out["rule_key"] = matched
+        out["category"] = matched.map(self.rules)
+        out["confidence"] = RULE_CONFIDENCE
+        out.loc[~has_hit, "confidence"] = float("nan")
+        out["reason"] = RULE_REASON_PREFIX + matched.where(has_hit, "")
+        out.loc[~has_hit, "reason"] = None
+        return out
+
+def get_rule_index(merchant_rules: "Dict[str, str] | RuleIndex", priorities: Dict[str, int] | None = None) -> RuleIndex:
+    if isinstance(merchant_rules, RuleIndex):
+        return merchant_rules
+    key = rules_hash(merchant_rules, priorities)
+    index = _INDEX_CACHE.get(key)
+    if index is None:
+        index = RuleIndex(merchant_rules, priorities)
+        _INDEX_CACHE[key] = index
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    else:
+        _INDEX_CACHE.move_to_end(key)
+    return index
@@ -0,0 +1,121 @@
+import glob
+import hashlib
+import os
+import uuid
+from typing import Iterable, Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from src.utils import month_labels
+
+# Columns kept per categorized row. "month" and "category" are the
+# partition keys and live in the directory names, not in the files.
+STORE_SCHEMA = pa.schema([
+    ("date", pa.timestamp("ns")),
+    ("amount", pa.float64()),
+    ("description", pa.string()),
+    ("desc_norm", pa.string()),
+    ("confidence", pa.float64()),
+    ("reason", pa.string()),
+    ("method", pa.string()),
+    ("anomaly_flags", pa.uint8()),
+    ("is_anomaly", pa.bool_()),
+    ("source", pa.string()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string()), ("category", pa.string())]), flavor="hive")
+_FULL_SCHEMA = pa.schema([*STORE_SCHEMA, *PARTITIONING.schema])
+
+class ResultStore:
+    """Parquet dataset of categorized rows, partitioned by month and category."""
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _source_key(source: str) -> str:
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+    def remove_source(self, source: str) -> int:
+        files = glob.glob(os.path.join(self.root, "*", "*", f"{self._source_key(source)}-*.parquet"))
+        for path in files:
+            os.remove(path)
+        return len(files)
+
+    def append(self, df: pd.DataFrame, source: str, replace: bool = True) -> int:
+        """Add categorized rows from `source`, replacing its earlier rows; returns rows written."""
+        if replace:
+            self.remove_source(source)
+        rows = df[df["date"].notna()]
+        if rows.empty:
+            return 0
+        data = {}
+        for field in STORE_SCHEMA:
+            if field.name == "source":
+                data["source"] = pa.array([source] * len(rows), type=pa.string())
+            elif field.name in rows.columns:
+                data[field.name] = pa.array(rows[field.name], type=field.type, from_pandas=True)
+            else:
+                data[field.name] = pa.nulls(len(rows), type=field.type)
+        data["month"] = pa.array(month_labels(rows["date"]), type=pa.string())
+        category = rows["category"] if "category" in rows.columns else pd.Series("Other", index=rows.index)
+        data["category"] = pa.array(category.fillna("Other").astype(str).to_numpy(), type=pa.string())
+
+        ds.write_dataset(
+            pa.table(data),
+            self.root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"{self._source_key(source)}-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        return len(rows)
+
+    def dataset(self) -> ds.Dataset:
+        return ds.dataset(self.root, format="parquet", partitioning=PARTITIONING, schema=_FULL_SCHEMA)
+
+    def _filter(self, months: Iterable[str] | None, categories: Iterable[str] | None):
+        expr = None
+        if months is not None:
+            expr = ds.field("month").isin(list(months))
+        if categories is not None:
+            cat = ds.field("category").isin(list(categories))
+            expr = cat if expr is None else expr & cat
+        return expr
+
+    def read(
+        self,
+        columns: List[str] | None = None,
+        months: Iterable[str] | None = None,
+        categories: Iterable[str] | None = None,
+    ) -> pd.DataFrame:
+        """Columns (all by default) of the matching month / category partitions."""
+        table = self.dataset().to_table(columns=columns, filter=self._filter(months, categories))
+        return table.to_pandas()
+
+    def iter_batches(
+        self,
+        columns: List[str] | None = None,
+        months: Iterable[str] | None = None,
+        categories: Iterable[str] | None = None,
+        batch_size: int = 250_000,
+    ) -> Iterator[pd.DataFrame]:
+        """Like read(), in DataFrames of about `batch_size` rows."""
+        pending: List[pa.RecordBatch] = []
+        rows = 0
+        for batch in self.dataset().to_batches(columns=columns, filter=self._filter(months, categories), batch_size=batch_size):
+            if not batch.num_rows:
+                continue
+            pending.append(batch)
+            rows += batch.num_rows
+            if rows >= batch_size:
+                yield pa.Table.from_batches(pending).to_pandas()
+                pending, rows = [], 0
+        if pending:
+            yield pa.Table.from_batches(pending).to_pandas()
+
+    def months(self) -> List[str]:
+        found = {os.path.basename(p).split("=", 1)[1] for p in glob.glob(os.path.join(self.root, "month=*"))}
+        return sorted(found)
+
@@ -1,8 +1,27 @@
+from typing import Iterable, List
 import pandas as pd
+from src.compact import result_amounts
+from src.profiling import profiled
+from src.rollup import Rollup
 
-def monthly_trend(df: pd.DataFrame) -> pd.DataFrame:
-    temp = df.copy()
-    temp["month"] = temp["date"].dt.to_period("M").astype(str)
+def _monthly_frame(source, columns: List[str], months: Iterable[str] | None = None) -> pd.DataFrame:
+    """`columns` plus a "month" column, from a DataFrame of rows or a
+    ResultStore; only those columns of the `months` partitions are read."""
+    if not isinstance(source, pd.DataFrame):
+        return source.read(columns=["month", *columns], months=months)
+    temp = pd.DataFrame({"month": source["date"].dt.to_period("M").astype(str)}, index=source.index)
+    for col in columns:
+        temp[col] = result_amounts(source) if col == "amount" else source[col].astype(object)
+    if months is not None:
+        temp = temp[temp["month"].isin(list(months))]
+    return temp
+
+@profiled("trends")
+def monthly_trend(df, months: Iterable[str] | None = None) -> pd.DataFrame:
+    """Month x category spend; `df` may be a DataFrame, a Rollup or a ResultStore."""
+    if isinstance(df, Rollup):
+        return df.monthly_trend(months)
+    temp = _monthly_frame(df, ["category", "amount"], months)
     pivot = temp.pivot_table(
         index="month",
         columns="category",
@@ -12,8 +31,26 @@ def monthly_trend(df: pd.DataFrame) -> pd.DataFrame:
     ).reset_index()
     return pivot.sort_values("month")
 
-def monthly_totals(df: pd.DataFrame) -> pd.DataFrame:
-    temp = df.copy()
-    temp["month"] = temp["date"].dt.to_period("M").astype(str)
+@profiled("trends")
+def monthly_totals(df, months: Iterable[str] | None = None) -> pd.DataFrame:
+    """Spend per month; `df` may be a DataFrame, a Rollup or a ResultStore."""
+    if isinstance(df, Rollup):
+        return df.monthly_totals(months)
+    temp = _monthly_frame(df, ["amount"], months)
     out = temp.groupby("month")["amount"].sum().reset_index().sort_values("month")
-    return out
\ No newline at end of file
+    return out
+
+@profiled("trends")
+def category_summary(df) -> pd.DataFrame:
+    """Spend and share per category; `df` may be a DataFrame or a Rollup."""
+    if isinstance(df, Rollup):
+        return df.category_summary()
+    summary = (
+        df.groupby("category")["amount"].sum()
+        .reset_index()
+        .sort_values("amount", ascending=False)
+    )
+
+    total_spend = summary["amount"].sum() if len(summary) else 0.0
+    summary["percent"] = (summary["amount"] / total_spend * 100).round(2) if total_spend else 0.0
+    return summary
\ No newline at end of file
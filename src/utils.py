@@ -1,5 +1,7 @@
 import re
-from typing import Any
+from typing import Any, Callable, Iterable
+import numpy as np
+import pandas as pd
 
 def normalize_text(x: Any) -> str:
     if x is None:
@@ -14,6 +16,65 @@ def normalize_for_match(s: str) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
+# Tokens that describe how or where a payment happened rather than who was paid
+PAYMENT_RAIL_TOKENS = frozenset({
+    "UPI", "NEFT", "IMPS", "RTGS", "ONLINE", "PAYMENT", "POS", "ECOM", "ACH",
+    "NACH", "ECS", "TXN", "REF", "INR", "RS",
+})
+CITY_CODES = frozenset({
+    "AHM", "AMD", "BLR", "BOM", "CCU", "CHE", "DEL", "GOA", "GGN", "HYD", "JAI",
+    "KOL", "LKO", "MAA", "MUM", "NDA", "PNQ", "PUN", "SUR",
+})
+_HAS_DIGIT = re.compile(r"\d")
+
+def map_unique(values: pd.Series, fn: Callable[[Any], str]) -> pd.Series:
+    """Apply a per-value string function once per distinct value of a column.
+
+    Missing values map to fn(None).
+    """
+    codes, uniques = pd.factorize(values)
+    # Missing values get code -1, which indexes the trailing fn(None) entry
+    mapped = np.array([fn(u) for u in uniques] + [fn(None)], dtype=object)
+    return pd.Series(mapped[codes], index=values.index, dtype=object)
+
+def month_labels(dates: pd.Series) -> pd.Series:
+    """"YYYY-MM" per date, formatting each distinct month once."""
+    ym = dates.dt.year * 100 + dates.dt.month
+    return map_unique(ym, lambda v: "" if v is None or pd.isna(v) else f"{int(v) // 100:04d}-{int(v) % 100:02d}")
+
+def normalize_text_column(values: pd.Series) -> pd.Series:
+    return map_unique(values, normalize_text)
+
+def normalize_for_match_column(values: pd.Series) -> pd.Series:
+    return map_unique(values, normalize_for_match)
+
+def merchant_fingerprint(s: str) -> str:
+    """Collapse a description to its merchant-identifying tokens.
+
+    Drops reference codes and amounts (any token containing a digit), payment
+    rail tokens and city codes, and repeated tokens, so recurring charges from
+    the same merchant share one key. Falls back to the normalized description
+    if nothing would be left.
+    """
+    return fingerprint_from_norm(normalize_for_match(s))
+
+def fingerprint_from_norm(norm: str) -> str:
+    """merchant_fingerprint() for an already normalize_for_match'ed string."""
+    kept = []
+    for tok in norm.split(" "):
+        if not tok or _HAS_DIGIT.search(tok) or tok in PAYMENT_RAIL_TOKENS or tok in CITY_CODES:
+            continue
+        if tok not in kept:
+            kept.append(tok)
+    return " ".join(kept) if kept else norm
+
+def fingerprint_ratio(desc_norm: Iterable[str]) -> float:
+    """Unique merchant fingerprints / rows over normalized descriptions;
+    lower means more LLM calls saved."""
+    norms = list(desc_norm)
+    fps = {fingerprint_from_norm(n) for n in set(norms)}
+    return len(fps) / len(norms) if norms else 0.0
+
 def safe_float(x: Any) -> float | None:
     try:
         return float(x)
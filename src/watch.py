@@ -0,0 +1,305 @@
+"""Watch-folder mode: process only the new rows of statement CSVs."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import BASELINES_PATH, DUPLICATE_INDEX_PATH, KNN_PATH, WATCH_POLL_S, WATCH_SETTLE_S
+from src.ingest import clean_frame, check_columns
+from src.parsers import detect_date_format
+from src.categorize import categorize_batch, knn_learn_mask
+from src.anomalies import detect_anomalies, render_anomaly_labels, POSSIBLE_DUPLICATE
+from src.baselines import BaselineStore
+from src.compact import export_frame
+from src.duplicates import DuplicateIndex
+from src.rollup import Rollup
+from src.trends import category_summary, monthly_totals
+from src.pipeline import PipelineOptions, STAGES, expand_inputs, load_resources
+from src.profiling import RunProfile, stage, count
+
+_EPOCH = pd.Timestamp("1970-01-01")
+# Bytes before the saved offset that must be unchanged for a file to be
+# treated as appended to rather than rewritten
+TAIL_CHECK_BYTES = 4096
+
+def row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """64-bit hash per valid row of (day, amount in cents, normalized description)."""
+    desc_norm = df["desc_norm"] if "desc_norm" in df.columns else df["description"]
+    keys = pd.DataFrame({
+        "day": (df["date"] - _EPOCH).dt.days.astype("int64").to_numpy(),
+        "amount_cents": (df["amount"] * 100).round().astype("int64").to_numpy(),
+        "desc_norm": desc_norm.fillna("").astype(str).to_numpy(),
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy().view("int64")
+
+class WatchState:
+    """Read offsets and seen row fingerprints per watched file."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS watched_files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                tail_hash TEXT NOT NULL,
+                date_format TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen_rows (
+                row_hash INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                seen INTEGER NOT NULL,
+                PRIMARY KEY (row_hash, source)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_rows_hash ON seen_rows(row_hash)")
+        self._conn.commit()
+
+    def file(self, path: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, offset, tail_hash, date_format FROM watched_files WHERE path = ?",
+                (path,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["size", "mtime_ns", "offset", "tail_hash", "date_format"], row))
+
+    def save_file(self, path: str, size: int, mtime_ns: int, offset: int, tail_hash: str, date_format: str | None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO watched_files (path, size, mtime_ns, offset, tail_hash, date_format, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, offset, tail_hash, date_format, time.time()),
+            )
+            self._conn.commit()
+
+    def new_rows(self, hashes: np.ndarray, source: str, continued: bool) -> Tuple[np.ndarray, np.ndarray, Dict[int, int]]:
+        """New-row mask, each row's occurrence number and the counts to pass
+        to mark_seen(); the k-th copy of a row is new unless some file had k + 1."""
+        own: Dict[int, int] = {}
+        other: Dict[int, int] = {}
+        keys = list(set(hashes.tolist()))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT row_hash, source, seen FROM seen_rows WHERE row_hash IN ({marks})",
+                    part,
+                ).fetchall()
+                for row_hash, row_source, seen in rows:
+                    if row_source == source:
+                        own[row_hash] = seen
+                    else:
+                        other[row_hash] = max(other.get(row_hash, 0), seen)
+
+        fps = pd.Series(hashes)
+        prior = fps.map(own).fillna(0).astype("int64").to_numpy()
+        occurrence = fps.groupby(hashes).cumcount().to_numpy() + (prior if continued else 0)
+        known = np.maximum(prior, fps.map(other).fillna(0).astype("int64").to_numpy())
+        seen = pd.Series(occurrence + 1).groupby(hashes).max()
+        counts = {int(h): max(int(n), own.get(int(h), 0)) for h, n in seen.items()}
+        return occurrence >= known, occurrence, counts
+
+    def mark_seen(self, counts: Dict[int, int], source: str) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seen_rows (row_hash, source, seen) VALUES (?, ?, ?)",
+                [(h, source, n) for h, n in counts.items()],
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM watched_files")
+            self._conn.execute("DELETE FROM seen_rows")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def _tail_hash(f, offset: int) -> str:
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+class Watcher:
+    """Polls `inputs` and processes new rows of new or changed CSV files."""
+    def __init__(self, inputs: List[str], opts: PipelineOptions, settle_s: float = WATCH_SETTLE_S):
+        from src.store import ResultStore
+        self.inputs = inputs
+        self.opts = opts
+        self.settle_s = settle_s
+        os.makedirs(opts.out_dir, exist_ok=True)
+        self.state = WatchState(os.path.join(opts.out_dir, "watch_state.sqlite"))
+        self.store = ResultStore(opts.results_store or os.path.join(opts.out_dir, "results"))
+        self.baselines = BaselineStore(BASELINES_PATH)
+        self.dup_index = DuplicateIndex(DUPLICATE_INDEX_PATH)
+        self.rollup_path = os.path.join(opts.out_dir, "rollup.csv")
+        self.rollup = Rollup.load(self.rollup_path)
+        self.profile = RunProfile()
+
+    def scan(self) -> List[Dict[str, Any]]:
+        """One pass over the inputs; returns a report per file that was read."""
+        reports = []
+        for path in expand_inputs(self.inputs):
+            try:
+                report = self.process_file(path)
+            except Exception as e:
+                # Retried once the file changes again
+                report = {"file": path, "error": str(e)}
+                try:
+                    st = os.stat(path)
+                    rec = self.state.file(path)
+                    self.state.save_file(path, st.st_size, st.st_mtime_ns, rec["offset"] if rec else 0, "", None)
+                except OSError as state_err:
+                    # Deleted or unreadable mid-pass: report it, retry next pass
+                    report["error"] += f"; state not saved: {state_err}"
+            if report is not None:
+                reports.append(report)
+        if reports:
+            with open(os.path.join(self.opts.out_dir, "run_profile.json"), "w", encoding="utf-8") as f:
+                f.write(self.profile.to_json())
+        return reports
+
+    def run(self, poll_s: float = WATCH_POLL_S, on_report: Callable[[Dict[str, Any]], None] | None = None) -> None:
+        """Scan every `poll_s` seconds until interrupted."""
+        while True:
+            for report in self.scan():
+                if on_report is not None:
+                    on_report(report)
+            time.sleep(poll_s)
+
+    def process_file(self, path: str) -> Dict[str, Any] | None:
+        """Process the rows of `path` not seen before; None if the file is
+        unchanged or still being written."""
+        st = os.stat(path)
+        rec = self.state.file(path)
+        if rec is not None and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+            return None
+        if time.time() - st.st_mtime < self.settle_s:
+            return None
+
+        with open(path, "rb") as f:
+            header = f.readline()
+            continued = (
+                rec is not None and rec["tail_hash"] != ""
+                and len(header) <= rec["offset"] <= st.st_size
+                and _tail_hash(f, rec["offset"]) == rec["tail_hash"]
+            )
+            offset = rec["offset"] if continued else len(header)
+            f.seek(offset)
+            # Only up to the size checked as settled; later writes wait
+            data = f.read(max(0, st.st_size - offset))
+            end = offset + len(data)
+            tail_hash = _tail_hash(f, end)
+
+        date_format = rec["date_format"] if continued else None
+        report: Dict[str, Any] = {"file": path, "continued": continued, "rows": 0, "new_rows": 0, "anomalies": 0}
+        if data.strip():
+            with RunProfile() as prof:
+                date_format = self._process_data(path, header, data, continued, date_format, report)
+            self.profile.merge(prof.report())
+            report.update({f"{s}_s": round(prof.stages.get(s, {}).get("seconds", 0.0), 3) for s in STAGES})
+        self.state.save_file(path, st.st_size, st.st_mtime_ns, end, tail_hash, date_format)
+        return report
+
+    def _process_data(self, path: str, header: bytes, data: bytes, continued: bool, date_format: str | None, report: Dict[str, Any]) -> str | None:
+        with stage("ingest"):
+            df = pd.read_csv(BytesIO(header + data), dtype=str, keep_default_na=False, na_values=[""])
+            if date_format is None:
+                check_columns(df)
+                date_format = detect_date_format(df["date"], dayfirst=self.opts.dayfirst)
+            df = clean_frame(df, date_format=date_format, dayfirst=self.opts.dayfirst, decimal=self.opts.decimal)
+            df_ok = df[df["row_valid"]].reset_index(drop=True)
+        count("rows_ingested", len(df))
+        report["rows"] = len(df)
+
+        new, occurrence, seen = self.state.new_rows(row_fingerprints(df_ok), path, continued)
+        fresh = df_ok[new].reset_index(drop=True)
+        count("watch_rows_new", len(fresh))
+        count("watch_rows_skipped", len(df_ok) - len(fresh))
+        report["new_rows"] = len(fresh)
+        if len(fresh):
+            report["anomalies"] = self._process_rows(path, fresh, occurrence[new] > 0)
+        # Only once the rows are stored, so a failed pass is redone
+        self.state.mark_seen(seen, path)
+        return date_format
+
+    def _process_rows(self, path: str, fresh: pd.DataFrame, repeated: np.ndarray) -> int:
+        opts = self.opts
+        source = os.path.basename(path)
+        llm_client, cache, knn = load_resources(opts)
+        results = categorize_batch(
+            fresh["description"].tolist(),
+            llm_client,
+            opts.categories,
+            opts.merchant_rules,
+            max_workers=opts.llm_workers,
+            batch_size=opts.llm_batch_size if opts.llm_enabled else 1,
+            cache=cache,
+            canonicalize=opts.canonicalize,
+            desc_norm=fresh["desc_norm"].tolist(),
+            knn=knn,
+            knn_learn=False,
+            compact_prompts=opts.compact_prompts,
+            llm_reasons=opts.llm_reasons,
+        )
+        frame = pd.concat([fresh, pd.DataFrame(results)], axis=1)
+
+        # A handful of new rows says little about typical amounts, so score
+        # them against the stored history and fold them in
+        scored = detect_anomalies(
+            frame,
+            manual_high_threshold=opts.manual_high_threshold,
+            with_labels=False,
+            baselines=self.baselines,
+            update_baselines=True,
+            dup_index=self.dup_index,
+            source=source,
+            update_dup_index=True,
+        )
+        # The in-batch duplicate check can't see identical rows of the same
+        # file from earlier passes; the fingerprint occurrence can
+        scored["anomaly_flags"] = scored["anomaly_flags"] | (POSSIBLE_DUPLICATE * repeated.astype(np.uint8))
+        # Same column order as detect_anomalies with labels
+        scored.insert(scored.columns.get_loc("is_anomaly"), "anomaly_labels", render_anomaly_labels(scored["anomaly_flags"], opts.manual_high_threshold))
+        scored["is_anomaly"] = scored["anomaly_flags"].gt(0)
+
+        self.rollup.merge(Rollup.from_rows(scored))
+        with stage("export"):
+            self.store.append(scored, source=source, replace=False)
+            anomalies = export_frame(scored[scored["is_anomaly"]]).assign(file=source)
+            if len(anomalies):
+                log = os.path.join(opts.out_dir, "anomalies.csv")
+                anomalies.to_csv(log, mode="a", header=not os.path.exists(log), index=False)
+            self.rollup.save(self.rollup_path)
+            category_summary(self.rollup).to_csv(os.path.join(opts.out_dir, "combined_category_summary.csv"), index=False)
+            monthly_totals(self.rollup).to_csv(os.path.join(opts.out_dir, "combined_monthly_totals.csv"), index=False)
+
+        if knn is not None:
+            learn = knn_learn_mask(scored)
+            if learn.any():
+                knn.learn(scored.loc[learn, "desc_norm"].tolist(), scored.loc[learn, "category"].tolist())
+                knn.save(KNN_PATH)
+        return int(scored["is_anomaly"].sum())